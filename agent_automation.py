@@ -1,19 +1,204 @@
-from typing import List, Dict, Any
-from src.tools.declaration_details_retriever import fetch_declaration_details
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Dict, Any, Optional, Sequence, Tuple
+from src.tools.declaration_details_retriever import (
+    fetch_declaration_details,
+    afetch_declaration_details
+)
+from src.tools.data_retriever import (
+    fetch_reference_data,
+    afetch_reference_data,
+    store_reference_data
+)
 from src.memory.agentstate import (
     RiskProfile,
     CDMInput,
     CDMExtracted,
     OrchestratorAgentState,
-    CDMDecision
+    CDMDecision,
+    DeclarationDetails,
+    TariffFeedback
 )
-from src.workflow.cdm_graph import run_cdm_manager
+from src.agents.tariff_verifier_agent import batch_tariff_verifier, abatch_tariff_verifier
+from src.workflow.cdm_graph import run_cdm_manager, arun_cdm_manager, RISK_TYPE_SOURCES
+from src.utils.llm_scheduler import llm_priority, BATCH
+
+# Max number of risk profiles processed in parallel per declaration
+RISK_CONCURRENCY = int(os.getenv("CDM_RISK_CONCURRENCY", "4"))
+
+# Max number of declarations processed in parallel per batch request
+BATCH_CONCURRENCY = int(os.getenv("CDM_BATCH_CONCURRENCY", "8"))
+
+
+def _check_declaration(declaration_details: Optional[DeclarationDetails]) -> bool:
+    if not declaration_details or not declaration_details.hs_code:
+        print("\n---> No HS Code found for this declaration ID")
+        return False
+
+    print("---> Declaration details fetched")
+    print("HS Code:", declaration_details.hs_code)
+    return True
+
+
+def _required_sources(risk_profiles: List[RiskProfile]) -> List[str]:
+    sources: List[str] = []
+    for risk_profile in risk_profiles:
+        risk_type = (risk_profile.risk_type or "").upper().strip()
+        for source in RISK_TYPE_SOURCES.get(risk_type, ()):
+            if source not in sources:
+                sources.append(source)
+    return sources
+
+
+def _prefetch_reference_data(
+    declaration_details: DeclarationDetails,
+    risk_profiles: List[RiskProfile]
+) -> CDMExtracted:
+    """
+    Resolves tariff / valuation data ONCE per declaration, for the union of
+    sources the risks need, so each risk skips its own retrieval.
+    """
+    prefetched = OrchestratorAgentState(
+        cdm_extracted=CDMExtracted(declaration_details=declaration_details)
+    )
+    sources = _required_sources(risk_profiles)
+    if sources:
+        print(f"---> Prefetching reference data: {', '.join(sources)}")
+        store_reference_data(
+            prefetched,
+            fetch_reference_data(declaration_details.hs_code, sources)
+        )
+    return prefetched.cdm_extracted
+
+
+async def _aprefetch_reference_data(
+    declaration_details: DeclarationDetails,
+    risk_profiles: List[RiskProfile]
+) -> CDMExtracted:
+    prefetched = OrchestratorAgentState(
+        cdm_extracted=CDMExtracted(declaration_details=declaration_details)
+    )
+    sources = _required_sources(risk_profiles)
+    if sources:
+        print(f"---> Prefetching reference data: {', '.join(sources)}")
+        store_reference_data(
+            prefetched,
+            await afetch_reference_data(declaration_details.hs_code, sources)
+        )
+    return prefetched.cdm_extracted
+
+
+def _build_orch_state(
+    declaration_id: str,
+    extracted: CDMExtracted,
+    risk_profile: RiskProfile,
+    tariff_feedback: Optional[TariffFeedback] = None
+) -> OrchestratorAgentState:
+
+    # Create NEW CDM Input (per risk)
+    cdm_input = CDMInput(
+        declaration_id=declaration_id,
+        risk_profile=risk_profile
+    )
+
+    # Task 1: Create NEW OrchestratorAgentState
+    return OrchestratorAgentState(
+        cdm_input=cdm_input,
+        cdm_extracted=extracted.model_copy(
+            update={"resolved_sources": list(extracted.resolved_sources)}
+        ),
+        # Pre-verified risks (batched tariff call) go straight to decide
+        cdm_decision=(
+            CDMDecision(risk_id=risk_profile.risk_id, tariff_feedback=tariff_feedback)
+            if tariff_feedback
+            else None
+        )
+    )
+
+
+def _risk_result(
+    risk_profile: RiskProfile,
+    orch_state: OrchestratorAgentState,
+    decision: Optional[CDMDecision]
+) -> Dict[str, Any]:
+
+    # Optional debug prints
+    print(
+        orch_state.tariff_feedback
+        if hasattr(orch_state, "tariff_feedback")
+        else "---> No tariff feedback available"
+    )
+    print(
+        orch_state.valuation_feedback
+        if hasattr(orch_state, "valuation_feedback")
+        else "---> No valuation feedback available"
+    )
+
+    # Store Output (JSON-safe)
+    return {
+        "risk_id": risk_profile.risk_id,
+        "output": {
+            "cdm_decision": decision.cdm_decision if decision else None,
+            "cdm_feedback": decision.cdm_feedback if decision else None
+        }
+    }
+
+
+def _process_risk(
+    declaration_id: str,
+    extracted: CDMExtracted,
+    risk_profile: RiskProfile,
+    tariff_feedback: Optional[TariffFeedback] = None
+) -> Dict[str, Any]:
+
+    print(f"\n---> Processing Risk ID: {risk_profile.risk_id}")
+
+    orch_state = _build_orch_state(declaration_id, extracted, risk_profile, tariff_feedback)
+
+    decision: CDMDecision | None = None
+
+    try:
+        orch_state = run_cdm_manager(orch_state)
+        decision = orch_state.cdm_decision
+    except Exception as e:
+        print(f"---> CDM failed for risk {risk_profile.risk_id}: {e}")
+
+    return _risk_result(risk_profile, orch_state, decision)
+
+
+async def _aprocess_risk(
+    declaration_id: str,
+    extracted: CDMExtracted,
+    risk_profile: RiskProfile,
+    tariff_feedback: Optional[TariffFeedback] = None
+) -> Dict[str, Any]:
+
+    print(f"\n---> Processing Risk ID: {risk_profile.risk_id}")
+
+    orch_state = _build_orch_state(declaration_id, extracted, risk_profile, tariff_feedback)
+
+    decision: CDMDecision | None = None
+
+    try:
+        orch_state = await arun_cdm_manager(orch_state)
+        decision = orch_state.cdm_decision
+    except Exception as e:
+        print(f"---> CDM failed for risk {risk_profile.risk_id}: {e}")
+
+    return _risk_result(risk_profile, orch_state, decision)
 
 
 def run_orchestrator(
     declaration_id: str,
-    risk_profiles: List[RiskProfile]
+    risk_profiles: List[RiskProfile],
+    max_concurrency: Optional[int] = None
 ) -> Dict[str, Any]:
+    """
+    Runs the CDM graph for every risk profile of a declaration.
+    Risks are processed concurrently (at most max_concurrency at a time,
+    default CDM_RISK_CONCURRENCY); results keep the input order.
+    """
 
     print("\n---> STARTING MULTI-RISK CDM AGENT FLOW\n")
 
@@ -29,65 +214,125 @@ def run_orchestrator(
         print(f"\n---> Failed to fetch declaration details: {e}")
         return final_output
 
-    if not declaration_details or not declaration_details.hs_code:
-        print("\n---> No HS Code found for this declaration ID")
+    if not _check_declaration(declaration_details):
         return final_output
 
-    print("---> Declaration details fetched")
-    print("HS Code:", declaration_details.hs_code)
+    # 2. Prefetch Reference Data (ONCE per declaration)
+    extracted = _prefetch_reference_data(declaration_details, risk_profiles)
 
-    # 2. Process EACH Risk Independently
-    for risk_profile in risk_profiles:
+    # 3. Verify same-declaration TARIFF risks in ONE LLM call where possible
+    batched = batch_tariff_verifier(
+        declaration_details, extracted.tariff_extracted_data, risk_profiles
+    )
 
-        print(f"\n---> Processing Risk ID: {risk_profile.risk_id}")
+    # 4. Process EACH Risk Independently (bounded parallelism, input order kept)
+    limit = max(1, max_concurrency or RISK_CONCURRENCY)
 
-        # Create NEW CDM Input (per risk)
-        cdm_input = CDMInput(
-            declaration_id=declaration_id,
-            risk_profile=risk_profile
-        )
+    if limit == 1 or len(risk_profiles) <= 1:
+        final_output["results"] = [
+            _process_risk(declaration_id, extracted, risk_profile, batched.get(index))
+            for index, risk_profile in enumerate(risk_profiles)
+        ]
+    else:
+        with ThreadPoolExecutor(max_workers=min(limit, len(risk_profiles))) as pool:
+            final_output["results"] = list(pool.map(
+                lambda item: _process_risk(
+                    declaration_id, extracted, item[1], batched.get(item[0])
+                ),
+                enumerate(risk_profiles)
+            ))
 
-        # Task 1: Create NEW OrchestratorAgentState
-        orch_state = OrchestratorAgentState(
-            cdm_input=cdm_input,
-            cdm_extracted=CDMExtracted(
-                declaration_details=declaration_details
-            ),
-            cdm_decision=None
-        )
+    print("\n---> MULTI-RISK CDM AGENT FLOW COMPLETED\n")
+    return final_output
 
-        decision: CDMDecision | None = None
-
-        try:
-            orch_state = run_cdm_manager(orch_state)
-            decision = orch_state.cdm_decision
-        except Exception as e:
-            print(f"---> CDM failed for risk {risk_profile.risk_id}: {e}")
-
-        # Store Output (JSON-safe)
-        final_output["results"].append({
-            "risk_id": risk_profile.risk_id,
-            "output": {
-                "cdm_decision": decision.cdm_decision if decision else None,
-                "cdm_feedback": decision.cdm_feedback if decision else None
-            }
-        })
-
-        # Optional debug prints
-        print(
-            orch_state.tariff_feedback
-            if hasattr(orch_state, "tariff_feedback")
-            else "---> No tariff feedback available"
-        )
-        print(
-            orch_state.valuation_feedback
-            if hasattr(orch_state, "valuation_feedback")
-            else "---> No valuation feedback available"
-        )
 
-        # Task 2: DELETE Orchestrator State
-        del orch_state
-        del decision
+async def arun_orchestrator(
+    declaration_id: str,
+    risk_profiles: List[RiskProfile],
+    max_concurrency: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Async variant of run_orchestrator. All network and LLM calls are awaited,
+    so a single event loop can keep many declarations in flight.
+    """
+
+    print("\n---> STARTING MULTI-RISK CDM AGENT FLOW (ASYNC)\n")
+
+    final_output: Dict[str, Any] = {
+        "declaration_id": declaration_id,
+        "results": []
+    }
+
+    try:
+        declaration_details = await afetch_declaration_details(declaration_id)
+    except Exception as e:
+        print(f"\n---> Failed to fetch declaration details: {e}")
+        return final_output
+
+    if not _check_declaration(declaration_details):
+        return final_output
+
+    extracted = await _aprefetch_reference_data(declaration_details, risk_profiles)
+
+    batched = await abatch_tariff_verifier(
+        declaration_details, extracted.tariff_extracted_data, risk_profiles
+    )
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or RISK_CONCURRENCY))
+
+    async def _bounded(index: int, risk_profile: RiskProfile) -> Dict[str, Any]:
+        async with semaphore:
+            return await _aprocess_risk(
+                declaration_id, extracted, risk_profile, batched.get(index)
+            )
+
+    # gather keeps input order; each risk handles its own failure
+    final_output["results"] = list(await asyncio.gather(
+        *(_bounded(index, risk_profile) for index, risk_profile in enumerate(risk_profiles))
+    ))
 
     print("\n---> MULTI-RISK CDM AGENT FLOW COMPLETED\n")
     return final_output
+
+
+async def arun_orchestrator_batch(
+    items: Sequence[Tuple[str, List[RiskProfile]]],
+    max_concurrency: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs arun_orchestrator for many (declaration_id, risk_profiles) items with
+    a bounded pool of workers and yields each result as soon as it finishes
+    (completion order, tagged with the item's index). A failing item yields
+    an inline error entry. Closing the generator cancels in-flight work.
+    LLM calls run at batch priority, behind interactive requests.
+    """
+
+    queue: asyncio.Queue = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def _worker() -> None:
+        llm_priority.set(BATCH)  # task-local
+        for index, (declaration_id, risk_profiles) in pending:
+            entry: Dict[str, Any] = {"index": index, "declaration_id": declaration_id}
+            try:
+                entry["status"] = "success"
+                entry["result"] = await arun_orchestrator(declaration_id, risk_profiles)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                entry["status"] = "error"
+                entry["error"] = str(e)
+            await queue.put(entry)
+
+    workers = [
+        asyncio.create_task(_worker())
+        for _ in range(min(len(items), max(1, max_concurrency or BATCH_CONCURRENCY)))
+    ]
+
+    try:
+        for _ in range(len(items)):
+            yield await queue.get()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,89 @@
+"""
+Benchmark: streaming tariff import (chunked read + COPY) on a synthetic
+multi-hundred-thousand-row file. Reports rows/sec and peak Python memory.
+
+By default only the client side is measured (read, chunk, serialize COPY
+buffers): that is parse throughput, not load throughput, and says nothing
+about COPY, merge or index cost on the server. With BENCH_DB=true it also
+runs the full DatabaseTool.import_excel_to_db load against DatabaseTool's
+database (DB_*), in swap mode and then upsert mode (same file → nothing
+changed); only those lines are load figures.
+
+Run from the repo root:
+    python -m benchmarks.bench_bulk_loader
+"""
+import csv
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from src.tools.bulk_loader import read_chunks, _copy_buffer, SWAP, UPSERT
+
+ROWS = int(os.getenv("BENCH_ROWS", "300000"))
+BENCH_TABLE = os.getenv("BENCH_TABLE", "tariff_data_bench")
+
+
+def _write_file(path):
+    rng = random.Random(7)
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["HSCode", "Goods Description", "Duty Fee", "Unit"])
+        for i in range(ROWS):
+            writer.writerow([
+                f"{rng.randrange(1, 98):02d}{i:08d}",
+                f"synthetic goods description number {i}",
+                rng.choice([0, 5, 10, 15, 20]),
+                rng.choice(["kg", "u", "l"]),
+            ])
+
+
+def _measure(label, fn):
+    # Timed and memory-traced separately: tracemalloc slows allocation-heavy code
+    start = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {rows:>8} rows {rows / elapsed:12,.0f} rows/s  peak {peak / 2**20:7.1f} MiB")
+
+
+def _client_side(path):
+    _, chunks = read_chunks(path)
+    rows = 0
+    for chunk in chunks:
+        _copy_buffer(chunk)
+        rows += len(chunk)
+    return rows
+
+
+def _read_all_pandas(path):
+    import pandas as pd
+    return len(pd.read_csv(path))
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tariff.csv")
+        _write_file(path)
+        print(f"file: {ROWS} rows, {os.path.getsize(path) / 2**20:.1f} MiB")
+
+        _measure("client: parse + COPY buffers", lambda: _client_side(path))
+        try:
+            _measure("client: pandas read (whole)", lambda: _read_all_pandas(path))
+        except ImportError:
+            pass
+
+        if os.getenv("BENCH_DB", "false").lower() == "true":
+            from src.tools.database_tool import DatabaseTool
+            db = DatabaseTool()
+            for mode in (SWAP, UPSERT):
+                _measure(
+                    f"db: COPY load ({mode})",
+                    lambda: db.import_excel_to_db(path, table_name=BENCH_TABLE, mode=mode)["rows"]
+                )
+        else:
+            print("load path not measured (client-side parse only); set BENCH_DB=true to time the COPY load")
@@ -0,0 +1,45 @@
+"""
+Micro-benchmark: HS code lookups against the in-memory index
+(exact, longest-prefix and extension matches) over a synthetic tariff table.
+
+Run from the repo root:
+    python -m benchmarks.bench_hs_code_index
+"""
+import random
+import time
+
+from src.tools.hs_code_index import HSCodeIndex
+
+ROWS = 200_000
+ITERATIONS = 100_000
+
+
+def _rows():
+    rng = random.Random(7)
+    for _ in range(ROWS):
+        code = f"{rng.randrange(1, 98):02d}{rng.randrange(0, 10**8):08d}"
+        yield {"hscode": code, "goods_description": "synthetic", "duty_fee": 5}
+
+
+def _bench(label, index, codes):
+    start = time.perf_counter()
+    for code in codes:
+        index.lookup(code)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(codes) * 1e6:10.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    index = HSCodeIndex(load_rows=_rows)
+    start = time.perf_counter()
+    loaded = index.reload()
+    print(f"{'load ' + str(loaded) + ' codes':<28} {time.perf_counter() - start:10.2f} s")
+
+    stored = index._snapshot.codes
+    rng = random.Random(11)
+    exact = [rng.choice(stored) for _ in range(ITERATIONS)]
+    prefix = [code + "99" for code in exact]   # 12 digits → falls back to the 10-digit row
+    extension = [code[:6] for code in exact]   # subheading → first narrower row
+    _bench("exact", index, exact)
+    _bench("longest prefix", index, prefix)
+    _bench("extension", index, extension)
@@ -0,0 +1,83 @@
+"""
+Benchmark: LlamaIndex query latency, cold (load the persisted index for
+every query, the old query_index behaviour) vs warm (resident engine),
+plus query_many over a batch.
+
+By default a synthetic tariff corpus of BENCH_ROWS rows is indexed into a
+temp dir with mock embeddings / LLM, so the figures isolate index load
+and retrieval cost. Point BENCH_INDEX_DIR at a real persisted index
+(e.g. data/index) to measure the full tariff corpus with the configured
+models instead.
+
+Run from the repo root:
+    python -m benchmarks.bench_llama_index
+"""
+import os
+import random
+import tempfile
+import time
+
+from llama_index.core import Document, Settings, VectorStoreIndex
+
+from src.tools.llama_index_tool import LlamaIndexTool
+
+ROWS = int(os.getenv("BENCH_ROWS", "20000"))
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "5"))
+BATCH = int(os.getenv("BENCH_BATCH", "16"))
+BENCH_INDEX_DIR = os.getenv("BENCH_INDEX_DIR")
+
+QUERIES = [
+    "What is the duty on portable computers?",
+    "HS code for live horses",
+    "Tariff for frozen fish fillets",
+    "Duty fee for cotton t-shirts",
+]
+
+
+def _build_synthetic(persist_dir):
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.llms import MockLLM
+
+    Settings.embed_model = MockEmbedding(embed_dim=256)
+    Settings.llm = MockLLM(max_tokens=16)
+
+    rng = random.Random(7)
+    documents = [
+        Document(text=f"HSCode: {rng.randrange(1, 98):02d}{i:08d}, Goods: synthetic goods {i}, "
+                      f"Duty: {rng.choice([0, 5, 10, 15, 20])}")
+        for i in range(ROWS)
+    ]
+    start = time.perf_counter()
+    VectorStoreIndex.from_documents(documents).storage_context.persist(persist_dir=persist_dir)
+    print(f"{'build ' + str(ROWS) + ' rows':<28} {time.perf_counter() - start:10.2f} s")
+
+
+def _bench(label, fn, count=ITERATIONS):
+    start = time.perf_counter()
+    for i in range(count):
+        fn(QUERIES[i % len(QUERIES)])
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / count * 1e3:10.1f} ms/query")
+
+
+def _run(persist_dir):
+    _bench("cold (load per query)", lambda q: LlamaIndexTool(persist_dir).query_index(q))
+
+    tool = LlamaIndexTool(persist_dir)
+    tool.query_index(QUERIES[0])  # load once
+    _bench("warm (resident engine)", tool.query_index)
+
+    batch = [QUERIES[i % len(QUERIES)] for i in range(BATCH)]
+    start = time.perf_counter()
+    tool.query_many(batch)
+    elapsed = time.perf_counter() - start
+    print(f"{'query_many x' + str(BATCH):<28} {elapsed / BATCH * 1e3:10.1f} ms/query")
+
+
+if __name__ == "__main__":
+    if BENCH_INDEX_DIR:
+        _run(BENCH_INDEX_DIR)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            _build_synthetic(tmp)
+            _run(tmp)
@@ -0,0 +1,27 @@
+"""
+Micro-benchmark: per-invocation overhead of building the CDM graph
+(old behaviour) vs fetching it from the compiled-workflow registry.
+
+Run from the repo root:
+    python -m benchmarks.bench_workflow_registry
+"""
+import time
+
+from src.workflow.cdm_graph import build_cdm_workflow, CDM_WORKFLOW
+from src.workflow.workflow_registry import workflow_registry
+
+ITERATIONS = 200
+
+
+def _bench(label, fn):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / ITERATIONS * 1e6:10.1f} us/invocation")
+
+
+if __name__ == "__main__":
+    workflow_registry.warm_up(CDM_WORKFLOW)
+    _bench("build + compile per call", build_cdm_workflow)
+    _bench("registry lookup", lambda: workflow_registry.get(CDM_WORKFLOW))
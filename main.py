@@ -1,10 +1,76 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from src.memory.agentstate import RiskProfile
-from agent_automation import run_orchestrator
+from src.workflow.workflow_registry import workflow_registry
+from src.tools.data_retriever import reference_cache_stats, invalidate_reference_cache, get_snapshot_syncer
+from src.tools.reference_snapshot import get_reference_snapshot, SNAPSHOT_ENABLED
+from src.utils.http_client import close_session, aclose_async_client
+from src.workflow.job_queue import JobQueue
+from src.utils.llm_scheduler import llm_scheduler, llm_priority, BATCH
+from src.utils.llm_backends import llm_backend_pool
+from src.utils.circuit_breaker import circuit_breaker_stats
+from src.utils.single_flight import single_flight_stats
+from src.tools.db_connector import init_db_pools, close_db_pools, db_pool_stats
+from src.tools.hs_code_index import get_hs_code_index, HS_INDEX_ENABLED
+from agent_automation import arun_orchestrator, arun_orchestrator_batch
 
-app = FastAPI(title="CDM Orchestrator API")
+
+async def _run_job(request: dict) -> dict:
+    # Each job runs in its own task, so this only affects the job
+    llm_priority.set(BATCH)
+    request = RunCDMRequest.model_validate(request)
+    output = await arun_orchestrator(
+        declaration_id=request.declaration_id,
+        risk_profiles=_to_risk_profiles(request)
+    )
+    return jsonable_encoder(output)
+
+
+# How often a streaming batch checks whether its client is still connected
+BATCH_DISCONNECT_POLL = float(os.getenv("CDM_BATCH_DISCONNECT_POLL", "0.5"))
+
+# Long-running CDM evaluations (persistent SQLite job store)
+job_queue = JobQueue(runner=_run_job)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile all CDM graph variants once at startup
+    workflow_registry.warm_up()
+    # Shared Postgres pools for the configured tariff / valuation databases
+    init_db_pools()
+    # In-memory HS code index over tariff_data (reloads when the table changes)
+    # (a failed first load is retried in the background; lookups fall back meanwhile)
+    if HS_INDEX_ENABLED:
+        get_hs_code_index().start()
+    # Local reference-data snapshot (bulk sync + delta refresh in the background)
+    if SNAPSHOT_ENABLED:
+        get_snapshot_syncer().start()
+    # Eject / re-admit LLM backends in the background
+    llm_backend_pool.start_health_checks()
+    # Resume queued / interrupted jobs
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    llm_backend_pool.stop_health_checks()
+    close_db_pools()
+    if HS_INDEX_ENABLED:
+        get_hs_code_index().stop()
+    if SNAPSHOT_ENABLED:
+        get_snapshot_syncer().stop()
+    # Release pooled keep-alive connections
+    await aclose_async_client()
+    close_session()
+
+
+app = FastAPI(title="CDM Orchestrator API", lifespan=lifespan)
 
 # Pydantic Models for API
 class RiskProfileRequest(BaseModel):
@@ -18,24 +84,30 @@ class RunCDMRequest(BaseModel):
     declaration_id: str
     risk_profiles: List[RiskProfileRequest]
 
+class CacheInvalidateRequest(BaseModel):
+    hs_code: Optional[str] = None  # None → invalidate everything
+
+def _to_risk_profiles(request: RunCDMRequest) -> List[RiskProfile]:
+    # Convert RiskProfileRequest → RiskProfile
+    return [
+        RiskProfile(
+            risk_id=r.risk_id,
+            risk_type=r.risk_type,
+            risk_description=r.risk_description,
+            risk_confidence_score=r.risk_confidence_score,
+            risk_recommended_action=r.risk_recommended_action
+        )
+        for r in request.risk_profiles
+    ]
+
 # API Route
 @app.post("/cdm_agent")
-def run_cdm_api(request: RunCDMRequest):
+async def run_cdm_api(request: RunCDMRequest):
     try:
-        # Convert RiskProfileRequest → RiskProfile
-        risk_profiles = [
-            RiskProfile(
-                risk_id=r.risk_id,
-                risk_type=r.risk_type,
-                risk_description=r.risk_description,
-                risk_confidence_score=r.risk_confidence_score,
-                risk_recommended_action=r.risk_recommended_action
-            )
-            for r in request.risk_profiles
-        ]
-
-        # Run orchestrator
-        output = run_orchestrator(
+        risk_profiles = _to_risk_profiles(request)
+
+        # Run orchestrator (async path, does not hold a threadpool worker)
+        output = await arun_orchestrator(
             declaration_id=request.declaration_id,
             risk_profiles=risk_profiles
         )
@@ -45,5 +117,149 @@ def run_cdm_api(request: RunCDMRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.post("/cdm_agent/batch")
+async def run_cdm_batch_api(requests: List[RunCDMRequest], http_request: Request):
+    """
+    Streams one NDJSON line per declaration as soon as it finishes:
+    {"index", "declaration_id", "status": "success" | "error", "result" | "error"}
+    """
+    items = [(r.declaration_id, _to_risk_profiles(r)) for r in requests]
+
+    async def _watch_disconnect():
+        while not await http_request.is_disconnected():
+            await asyncio.sleep(BATCH_DISCONNECT_POLL)
+
+    async def _ndjson():
+        results = arun_orchestrator_batch(items)
+        # Watched concurrently: a client leaving mid-batch must not wait for
+        # the next declaration to finish before its work is cancelled
+        watcher = asyncio.create_task(_watch_disconnect())
+        try:
+            while True:
+                next_entry = asyncio.ensure_future(results.__anext__())
+                await asyncio.wait({next_entry, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_entry.done():
+                    # Cancelling the pending step unwinds the generator, which cancels its workers
+                    next_entry.cancel()
+                    await asyncio.gather(next_entry, return_exceptions=True)
+                    break
+                try:
+                    entry = next_entry.result()
+                except StopAsyncIteration:
+                    break
+                yield json.dumps(jsonable_encoder(entry)) + "\n"
+        finally:
+            watcher.cancel()
+            # Client gone (or done): cancel whatever is still running
+            await results.aclose()
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+# Job API: submit → poll → (optional) cancel
+# (submit / cancel wake or cancel local workers, so they run on the event loop)
+@app.post("/cdm_jobs")
+async def submit_cdm_job_api(request: RunCDMRequest):
+    job_id = await job_queue.submit(request.model_dump())
+    return {"status": "success", "result": {"job_id": job_id, "job_status": "queued"}}
+
+
+@app.get("/cdm_jobs/{job_id}")
+def cdm_job_status_api(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return {
+        "status": "success",
+        "result": {
+            "job_id": job_id,
+            "job_status": job["status"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "error": job["error"],
+            "output": job["result"],
+        }
+    }
+
+
+@app.delete("/cdm_jobs/{job_id}")
+async def cancel_cdm_job_api(job_id: str):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if not await job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return {"status": "success", "result": {"job_id": job_id, "job_status": "cancelled"}}
+
+
+@app.get("/admin/jobs")
+def job_queue_stats_api():
+    return {"status": "success", "result": job_queue.stats()}
+
+# Admin: reference data cache
+@app.get("/admin/reference_cache")
+def reference_cache_stats_api():
+    return {"status": "success", "result": reference_cache_stats()}
+
+
+@app.post("/admin/reference_cache/invalidate")
+def invalidate_reference_cache_api(request: CacheInvalidateRequest):
+    removed = invalidate_reference_cache(request.hs_code)
+    return {"status": "success", "result": {"hs_code": request.hs_code, "removed": removed}}
+
+# Admin: reference data snapshot (version, staleness, hit rates)
+@app.get("/admin/reference_snapshot")
+def reference_snapshot_stats_api():
+    if not SNAPSHOT_ENABLED:
+        return {"status": "success", "result": {"enabled": False}}
+    return {"status": "success", "result": {"enabled": True, **get_reference_snapshot().stats()}}
+
+
+@app.post("/admin/reference_snapshot/sync")
+def reference_snapshot_sync_api():
+    if not SNAPSHOT_ENABLED:
+        raise HTTPException(status_code=409, detail="Reference snapshot is disabled (REFERENCE_SNAPSHOT_MODE)")
+    return {"status": "success", "result": get_snapshot_syncer().run_once()}
+
+# Admin: LLM scheduler (in-flight limit, queue depth, wait times)
+@app.get("/admin/llm_scheduler")
+def llm_scheduler_stats_api():
+    return {"status": "success", "result": llm_scheduler.stats()}
+
+
+@app.get("/admin/llm_backends")
+def llm_backends_stats_api():
+    return {"status": "success", "result": llm_backend_pool.stats()}
+
+# Admin: circuit breakers (graphql / tariff / valuation / ollama)
+@app.get("/admin/circuit_breakers")
+def circuit_breakers_api():
+    return {"status": "success", "result": circuit_breaker_stats()}
+
+# Admin: coalesced (single-flight) lookups
+@app.get("/admin/single_flight")
+def single_flight_api():
+    return {"status": "success", "result": single_flight_stats()}
+
+# Admin: Postgres connection pools (size, utilization, checkout waits)
+@app.get("/admin/db_pools")
+def db_pools_api():
+    return {"status": "success", "result": db_pool_stats()}
+
+# Admin: HS code index
+@app.get("/admin/hs_index")
+def hs_index_stats_api():
+    if not HS_INDEX_ENABLED:
+        return {"status": "success", "result": {"enabled": False}}
+    return {"status": "success", "result": {"enabled": True, **get_hs_code_index().stats()}}
+
+
+@app.post("/admin/hs_index/reload")
+def hs_index_reload_api():
+    if not HS_INDEX_ENABLED:
+        raise HTTPException(status_code=409, detail="HS code index is disabled (HS_INDEX_ENABLED)")
+    return {"status": "success", "result": {"codes": get_hs_code_index().reload()}}
+
 # To run the API, use the command:
 # uvicorn main:app --reload --host 0.0.0.0 --port 8000
\ No newline at end of file
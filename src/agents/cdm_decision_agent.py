@@ -1,14 +1,33 @@
-from typing import Optional
+import os
+from typing import Optional, Tuple
 import requests
 from config import OLLAMA_URL, MODEL_NAME
 from src.memory.agentstate import (
     OrchestratorAgentState,
     CDMDecision,
+    CDMDecisionOutput,
+    CDMExplanationOutput,
+    RiskProfile,
     TariffFeedback,
     ValuationFeedback
 )
 #from langgraph import agent
-from src.utils.client_llm import llm
+from src.utils.client_llm import (
+    llm,
+    allm,
+    llm_structured,
+    allm_structured,
+    json_response_format,
+    LLM_STRUCTURED_OUTPUT
+)
+
+# Risk types whose verifier prompt also writes the decision justification
+# (one LLM round trip per risk instead of two)
+FUSED_RISK_TYPES = {
+    t.strip().upper()
+    for t in os.getenv("CDM_FUSED_RISK_TYPES", "VALUATION").split(",")
+    if t.strip()
+}
 
 
 def _normalize_status(status: Optional[str]) -> str:
@@ -16,57 +35,69 @@ def _normalize_status(status: Optional[str]) -> str:
         return ""
     return str(status).strip().upper()
 
-#@agent(name="cdm_decision_agent", description="Make final CDM decision based on verifier feedback.")
-def cdm_decision_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentState:
-    """
-    CDM FINAL DECISION NODE (Single risk profile only)
 
-    - Uses rule-based mapping FIRST
-    - LLM is used ONLY for explanation
-    - Stores final decision in orch_data.cdm_decision
-    """
+def _rule_based_decision(status: str) -> Optional[str]:
+    if "UNDER" in status or "OVER" in status:
+        return "CORRECTION"
 
-    print("[CDM DECISION NODE] Executing")
+    elif "INVALID" in status or "INCORRECT HS" in status or "NO DATA" in status:
+        return "INVALID HS CODE"
 
-    decision = orch_data.cdm_decision
-    if decision is None:
-        raise ValueError("CDMDecision missing in OrchestratorAgentState")
+    elif "ACCEPT" in status:
+        return "ACCEPTED"
 
-    # Pick whichever feedback exists
-    feedback: Optional[TariffFeedback | ValuationFeedback] = (
-        decision.tariff_feedback
-        if decision.tariff_feedback
-        else decision.valuation_feedback
-    )
+    elif "NEED REVIEW" in status or "ERROR" in status:
+        return "NEED REVIEW"
 
-    if feedback is None:
-        decision.cdm_decision = "INVALID HS CODE"
-        decision.cdm_feedback = "No verifier feedback available; HS code may be invalid."
-        orch_data.orchestrator_status = "DECIDING"
-        return orch_data
+    return None  # fallback to LLM
 
-    status = _normalize_status(feedback.status)
 
-    # RULE-BASED DECISION
-    if "UNDER" in status or "OVER" in status:
-        final_decision = "CORRECTION"
+def decision_from_status(status: Optional[str]) -> Optional[str]:
+    """Rule-based CDM decision for a verifier status (None → needs LLM)."""
+    return _rule_based_decision(_normalize_status(status))
 
-    elif "INVALID" in status or "INCORRECT HS" in status or "NO DATA" in status:
-        final_decision = "INVALID HS CODE"
 
-    elif "ACCEPT" in status:
-        final_decision = "ACCEPTED"
+def is_fused_risk(risk_profile: RiskProfile) -> bool:
+    return (risk_profile.risk_type or "").upper().strip() in FUSED_RISK_TYPES
 
-    elif "NEED REVIEW" in status or "ERROR" in status:
-        final_decision = "NEED REVIEW"
 
-    else:
-        final_decision = None  # fallback to LLM
+def split_justification(reply: str) -> Tuple[str, Optional[str]]:
+    """Splits a fused verifier reply into (verifier part, justification)."""
+    if "Justification:" not in reply:
+        return reply, None
+    verifier_part, justification = reply.split("Justification:", 1)
+    return verifier_part.strip(), justification.strip() or None
 
-    # LLM FOR EXPLANATION (RULE HIT)
-    if final_decision:
-        try:
-            prompt = f"""
+
+def store_fused_decision(
+    decision: CDMDecision,
+    justification: Optional[str]
+) -> None:
+    """Stores the final decision written by a fused verifier prompt."""
+    feedback = decision.tariff_feedback or decision.valuation_feedback
+    final_decision = decision_from_status(feedback.status if feedback else None)
+    if final_decision and justification:
+        decision.cdm_decision = final_decision
+        decision.cdm_feedback = justification
+
+
+def _explanation_format() -> str:
+    if LLM_STRUCTURED_OUTPUT:
+        return json_response_format(CDMExplanationOutput)
+    return "Explanation: <text>"
+
+
+def _decision_format() -> str:
+    if LLM_STRUCTURED_OUTPUT:
+        return json_response_format(CDMDecisionOutput)
+    return "Decision: <value>\nExplanation: <text>"
+
+
+def _explanation_prompt(
+    feedback: TariffFeedback | ValuationFeedback,
+    final_decision: str
+) -> str:
+    return f"""
                     You are a senior customs officer.
 
                     Verifier Status:
@@ -80,26 +111,20 @@ def cdm_decision_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentSt
                     Write a concise technical justification (max 50 words).
 
                     Response format:
-                    Explanation: <text>
+                    {_explanation_format()}
                     """
-            out = llm(prompt).strip()
-            explanation = (
-                out.split("Explanation:")[1].strip()
-                if "Explanation:" in out
-                else out
-            )
 
-        except Exception:
-            explanation = f"Final decision derived from verifier status: {feedback.status}"
 
-        decision.cdm_decision = final_decision
-        decision.cdm_feedback = explanation
-        orch_data.orchestrator_status = "DECIDING"
-        return orch_data
+def _parse_explanation(out: str) -> str:
+    return (
+        out.split("Explanation:")[1].strip()
+        if "Explanation:" in out
+        else out
+    )
 
-    # FALLBACK: FULL LLM DECISION
-    try:
-        prompt = f"""
+
+def _decision_prompt(feedback: TariffFeedback | ValuationFeedback) -> str:
+    return f"""
                     You are a senior CDM Decision Officer.
 
                     Verifier Status:
@@ -114,36 +139,181 @@ def cdm_decision_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentSt
                     Provide short explanation (<=50 words).
 
                     Response format:
-                    Decision: <value>
-                    Explanation: <text>
+                    {_decision_format()}
                     """
-        out = llm(prompt).strip()
-
-        decision_label = (
-            out.split("Decision:")[1].split("\n")[0].strip().upper()
-            if "Decision:" in out
-            else out.split("\n")[0].strip().upper()
-        )
-
-        if "ACCEPT" in decision_label:
-            final_decision = "ACCEPTED"
-        elif "CORRECT" in decision_label:
-            final_decision = "CORRECTION"
-        elif "INSPECT" in decision_label:
-            final_decision = "INSPECTION"
-        elif "DECLINE" in decision_label or "REJECT" in decision_label:
-            final_decision = "DECLINED"
-        else:
-            final_decision = "NEED REVIEW"
-
-        explanation = (
-            out.split("Explanation:")[1].strip()
-            if "Explanation:" in out
-            else out
-        )
+
+
+def _parse_decision(out: str) -> Tuple[str, str]:
+    decision_label = (
+        out.split("Decision:")[1].split("\n")[0]
+        if "Decision:" in out
+        else out.split("\n")[0]
+    )
+    return _decision_label(decision_label), _parse_explanation(out)
+
+
+def _decision_label(decision_label: str) -> str:
+    decision_label = decision_label.strip().upper()
+
+    if "ACCEPT" in decision_label:
+        final_decision = "ACCEPTED"
+    elif "CORRECT" in decision_label:
+        final_decision = "CORRECTION"
+    elif "INSPECT" in decision_label:
+        final_decision = "INSPECTION"
+    elif "DECLINE" in decision_label or "REJECT" in decision_label:
+        final_decision = "DECLINED"
+    else:
+        final_decision = "NEED REVIEW"
+
+    return final_decision
+
+
+def _llm_explanation(feedback: TariffFeedback | ValuationFeedback, final_decision: str) -> str:
+    prompt = _explanation_prompt(feedback, final_decision)
+    if LLM_STRUCTURED_OUTPUT:
+        return llm_structured(prompt, CDMExplanationOutput).explanation.strip()
+    return _parse_explanation(
+        llm(prompt, stop_fields=("Explanation:",), max_words=50).strip()
+    )
+
+
+async def _allm_explanation(feedback: TariffFeedback | ValuationFeedback, final_decision: str) -> str:
+    prompt = _explanation_prompt(feedback, final_decision)
+    if LLM_STRUCTURED_OUTPUT:
+        return (await allm_structured(prompt, CDMExplanationOutput)).explanation.strip()
+    return _parse_explanation(
+        (await allm(prompt, stop_fields=("Explanation:",), max_words=50)).strip()
+    )
+
+
+def _llm_decision(feedback: TariffFeedback | ValuationFeedback) -> Tuple[str, str]:
+    prompt = _decision_prompt(feedback)
+    if LLM_STRUCTURED_OUTPUT:
+        output = llm_structured(prompt, CDMDecisionOutput)
+        return _decision_label(output.decision), output.explanation.strip()
+    return _parse_decision(
+        llm(prompt, stop_fields=("Decision:", "Explanation:"), max_words=50).strip()
+    )
+
+
+async def _allm_decision(feedback: TariffFeedback | ValuationFeedback) -> Tuple[str, str]:
+    prompt = _decision_prompt(feedback)
+    if LLM_STRUCTURED_OUTPUT:
+        output = await allm_structured(prompt, CDMDecisionOutput)
+        return _decision_label(output.decision), output.explanation.strip()
+    return _parse_decision(
+        (await allm(prompt, stop_fields=("Decision:", "Explanation:"), max_words=50)).strip()
+    )
+
+
+def _prepare_decision(
+    orch_data: OrchestratorAgentState
+) -> Optional[Tuple[CDMDecision, TariffFeedback | ValuationFeedback]]:
+    """
+    Returns (decision, feedback), or None when no verifier feedback exists
+    (in which case the decision has already been stored).
+    """
+
+    decision = orch_data.cdm_decision
+    if decision is None:
+        raise ValueError("CDMDecision missing in OrchestratorAgentState")
+
+    # Pick whichever feedback exists
+    feedback: Optional[TariffFeedback | ValuationFeedback] = (
+        decision.tariff_feedback
+        if decision.tariff_feedback
+        else decision.valuation_feedback
+    )
+
+    if feedback is None:
+        decision.cdm_decision = "INVALID HS CODE"
+        decision.cdm_feedback = "No verifier feedback available; HS code may be invalid."
+        orch_data.orchestrator_status = "DECIDING"
+        return None
+
+    # Fused verifier prompt already produced decision + justification
+    if decision.cdm_decision and decision.cdm_feedback:
+        print("[CDM DECISION NODE] Using fused verifier justification")
+        orch_data.orchestrator_status = "DECIDING"
+        return None
+
+    return decision, feedback
+
+
+#@agent(name="cdm_decision_agent", description="Make final CDM decision based on verifier feedback.")
+def cdm_decision_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentState:
+    """
+    CDM FINAL DECISION NODE (Single risk profile only)
+
+    - Uses rule-based mapping FIRST
+    - LLM is used ONLY for explanation
+    - Stores final decision in orch_data.cdm_decision
+    """
+
+    print("[CDM DECISION NODE] Executing")
+
+    prepared = _prepare_decision(orch_data)
+    if prepared is None:
+        return orch_data
+    decision, feedback = prepared
+
+    # RULE-BASED DECISION
+    final_decision = _rule_based_decision(_normalize_status(feedback.status))
+
+    # LLM FOR EXPLANATION (RULE HIT)
+    if final_decision:
+        try:
+            explanation = _llm_explanation(feedback, final_decision)
+
+        except Exception:
+            explanation = f"Final decision derived from verifier status: {feedback.status}"
+
+        decision.cdm_decision = final_decision
+        decision.cdm_feedback = explanation
+        orch_data.orchestrator_status = "DECIDING"
+        return orch_data
+
+    # FALLBACK: FULL LLM DECISION
+    try:
+        decision.cdm_decision, decision.cdm_feedback = _llm_decision(feedback)
+
+    except Exception as e:
+        decision.cdm_decision = "ERROR"
+        decision.cdm_feedback = f"Decision failed: {str(e)}"
+
+    orch_data.orchestrator_status = "DECIDING"
+    return orch_data
+
+
+async def acdm_decision_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentState:
+    """
+    Async variant of cdm_decision_agent.
+    """
+
+    print("[CDM DECISION NODE] Executing")
+
+    prepared = _prepare_decision(orch_data)
+    if prepared is None:
+        return orch_data
+    decision, feedback = prepared
+
+    final_decision = _rule_based_decision(_normalize_status(feedback.status))
+
+    if final_decision:
+        try:
+            explanation = await _allm_explanation(feedback, final_decision)
+
+        except Exception:
+            explanation = f"Final decision derived from verifier status: {feedback.status}"
 
         decision.cdm_decision = final_decision
         decision.cdm_feedback = explanation
+        orch_data.orchestrator_status = "DECIDING"
+        return orch_data
+
+    try:
+        decision.cdm_decision, decision.cdm_feedback = await _allm_decision(feedback)
 
     except Exception as e:
         decision.cdm_decision = "ERROR"
@@ -2,19 +2,12 @@ from src.memory.agentstate import (
     OrchestratorAgentState,
     RiskProfile
 )
-from src.agents.tariff_verifier_agent import tariff_verifier_agent
-from src.agents.valuation_verifier_agent import valuation_verifier_agent
+from src.agents.tariff_verifier_agent import tariff_verifier_agent, atariff_verifier_agent
+from src.agents.valuation_verifier_agent import valuation_verifier_agent, avaluation_verifier_agent
 #from langgraph import agent
 
-#@agent(name="cdm_executor_agent", description="Execute tariff or valuation verification agents.")
-def cdm_executor_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentState:
-    """
-    Executes a SINGLE risk profile in the OrchestratorAgentState.
-    Routes based on risk_type:
-    - TARIFF    → tariff_verifier_agent
-    - VALUATION → valuation_verifier_agent
-    """
 
+def _validated_risk_profile(orch_data: OrchestratorAgentState) -> RiskProfile:
     # Basic Validations
     if orch_data.cdm_input is None:
         raise ValueError("CDM Input missing in OrchestratorAgentState")
@@ -26,6 +19,20 @@ def cdm_executor_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentSt
     if not isinstance(risk_profile, RiskProfile):
         raise ValueError("Invalid risk profile object")
 
+    return risk_profile
+
+
+#@agent(name="cdm_executor_agent", description="Execute tariff or valuation verification agents.")
+def cdm_executor_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentState:
+    """
+    Executes a SINGLE risk profile in the OrchestratorAgentState.
+    Routes based on risk_type:
+    - TARIFF    → tariff_verifier_agent
+    - VALUATION → valuation_verifier_agent
+    """
+
+    risk_profile = _validated_risk_profile(orch_data)
+
     # Update Status
     orch_data.orchestrator_status = "EXECUTING"
 
@@ -50,3 +57,33 @@ def cdm_executor_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentSt
     # Execution Complete
     orch_data.orchestrator_status = "DECIDING"
     return orch_data
+
+
+async def acdm_executor_agent(orch_data: OrchestratorAgentState) -> OrchestratorAgentState:
+    """
+    Async variant of cdm_executor_agent.
+    """
+
+    risk_profile = _validated_risk_profile(orch_data)
+
+    orch_data.orchestrator_status = "EXECUTING"
+
+    risk_type = (risk_profile.risk_type or "").upper().strip()
+
+    if risk_type == "TARIFF":
+        await atariff_verifier_agent(
+            orch_data=orch_data,
+            risk_profile=risk_profile
+        )
+
+    elif risk_type == "VALUATION":
+        await avaluation_verifier_agent(
+            orch_data=orch_data,
+            risk_profile=risk_profile
+        )
+
+    else:
+        print(f"[CDM EXECUTOR] Unknown risk_type: {risk_type}")
+
+    orch_data.orchestrator_status = "DECIDING"
+    return orch_data
@@ -1,28 +1,168 @@
-from typing import Optional
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
 
 from src.memory.agentstate import (
+    DeclarationDetails,
+    FusedVerifierOutput,
+    TariffBatchOutput,
     TariffExtractedData,
     TariffFeedback,
     CDMDecision,
     OrchestratorAgentState,
     RiskProfile
 )
+from src.utils.hs_code import normalize_hs_code
+from src.utils.circuit_breaker import get_circuit_breaker
 from config import OLLAMA_URL, MODEL_NAME
 #from langgraph import agent
-from src.utils.client_llm import llm
+from src.utils.client_llm import (
+    llm,
+    allm,
+    llm_structured,
+    allm_structured,
+    json_response_format,
+    LLM_STRUCTURED_OUTPUT
+)
+from src.agents.cdm_decision_agent import (
+    is_fused_risk,
+    split_justification,
+    store_fused_decision
+)
 
+# Deterministic pre-check: a declared description whose tokens are covered
+# by the tariff description at or above MATCH (0..1) counts as a match.
+# Anything lower is never a deterministic mismatch (short declarations
+# against verbose tariff text score low even when correct): it goes to the
+# LLM, like unparsable fields
+TARIFF_PRECHECK_ENABLED = os.getenv("TARIFF_PRECHECK_ENABLED", "true").lower() == "true"
+TARIFF_DESCRIPTION_MATCH_THRESHOLD = float(os.getenv("TARIFF_DESCRIPTION_MATCH_THRESHOLD", "0.9"))
 
+# Batch verification of several TARIFF risks of one declaration in one call
+TARIFF_BATCH_ENABLED = os.getenv("TARIFF_BATCH_ENABLED", "true").lower() == "true"
 
-# Tariff Verifier Agent
-#@agent(name="tariff_verifier_agent", description="Verify tariff details using LLM.")
-def tariff_verifier_agent(
+TARIFF_STATUSES = (
+    "ACCEPTED",
+    "INCORRECT HS CODE",
+    "DESCRIPTION MISMATCH",
+    "DUTY PERCENTAGE MISMATCH",
+)
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_TOKEN = re.compile(r"[a-z0-9]+")
+_KEYWORD_TOKEN = re.compile(r"[a-z%]+")
+
+# field -> (status on mismatch, keywords in risk_description that prioritise it)
+_TARIFF_FIELDS = {
+    "hs_code": ("INCORRECT HS CODE", ("hs", "hscode", "code", "classification", "heading")),
+    "duty": ("DUTY PERCENTAGE MISMATCH", ("duty", "rate", "percentage", "%")),
+    "description": ("DESCRIPTION MISMATCH", ("description", "goods", "desc")),
+}
+
+
+def _parse_duty(value: Optional[str]) -> Optional[float]:
+    """ "5%", "5.0", " 5 % " -> 5.0 """
+    if value is None:
+        return None
+    match = _NUMBER.search(str(value).replace(",", "."))
+    return float(match.group()) if match else None
+
+
+def _description_similarity(declared: Optional[str], official: Optional[str]) -> Optional[float]:
+    """Share of the declared description's tokens found in the official one (|A∩B| / |A|)."""
+    tokens_a = set(_TOKEN.findall((declared or "").lower()))
+    tokens_b = set(_TOKEN.findall((official or "").lower()))
+    if not tokens_a or not tokens_b:
+        return None
+    return len(tokens_a & tokens_b) / len(tokens_a)
+
+
+def _field_order(risk_description: Optional[str]) -> List[str]:
+    """Field named in the risk reason first, then the rest."""
+    # Whole words only: "hs" must not match "months", "rate" not "accurate"
+    words = set(_KEYWORD_TOKEN.findall((risk_description or "").lower()))
+    for field, (_, keywords) in _TARIFF_FIELDS.items():
+        if words.intersection(keywords):
+            return [field] + [f for f in _TARIFF_FIELDS if f != field]
+    return list(_TARIFF_FIELDS)
+
+
+def _prefix_note(tariff_data: TariffExtractedData) -> str:
+    if not tariff_data.matched_prefix:
+        return ""
+    return " (closest tariff entry for the declared code, not an exact code match)"
+
+
+def _deterministic_tariff_check(
+    declaration: DeclarationDetails,
+    tariff_data: TariffExtractedData,
+    risk_profile: RiskProfile
+) -> Optional[TariffFeedback]:
+    """
+    Compares declaration vs tariff row without the LLM.
+    Returns feedback for clear matches / mismatches, None when ambiguous.
+    """
+    # A prefix fallback row has a different code by construction: let the LLM judge it
+    if tariff_data.matched_prefix:
+        return None
+
+    declared_hs = normalize_hs_code(declaration.hs_code)
+    tariff_hs = normalize_hs_code(tariff_data.hs_code)
+    declared_duty = _parse_duty(declaration.hs_code_duty_fee)
+    tariff_duty = _parse_duty(tariff_data.duty_percentage)
+    similarity = _description_similarity(declaration.goods_description, tariff_data.description)
+
+    # True = match, False = mismatch, None = cannot decide deterministically
+    results = {
+        "hs_code": (declared_hs == tariff_hs) if declared_hs and tariff_hs else None,
+        "duty": (
+            abs(declared_duty - tariff_duty) < 1e-6
+            if declared_duty is not None and tariff_duty is not None
+            else None
+        ),
+        # Only a confident match is decided here; a description mismatch is the LLM's call
+        "description": (
+            True if similarity is not None and similarity >= TARIFF_DESCRIPTION_MATCH_THRESHOLD else None
+        ),
+    }
+
+    # Same priority order as the LLM prompt: stop at the first mismatch
+    for field in _field_order(risk_profile.risk_description):
+        if results[field] is None:
+            return None
+        if results[field] is False:
+            explanations = {
+                "hs_code": (
+                    f"Declared HS code {declaration.hs_code} does not match the official "
+                    f"tariff HS code {tariff_data.hs_code}."
+                ),
+                "duty": (
+                    f"Declared duty {declaration.hs_code_duty_fee} differs from the official duty "
+                    f"{tariff_data.duty_percentage} for HS code {tariff_data.hs_code}."
+                ),
+            }
+            return TariffFeedback(
+                status=_TARIFF_FIELDS[field][0],
+                explanation=f"{explanations[field]} (deterministic check)"
+            )
+
+    return TariffFeedback(
+        status="ACCEPTED",
+        explanation=(
+            f"Declared HS code {declaration.hs_code}, duty {declaration.hs_code_duty_fee} and description "
+            f"match the official tariff entry {tariff_data.hs_code}. (deterministic check)"
+        )
+    )
+
+
+def _prepare_tariff_prompt(
     orch_data: OrchestratorAgentState,
     risk_profile: RiskProfile
-) -> None:
+) -> Optional[str]:
     """
-    Verifies tariff details using LLM.
-    Reads data from orch_data.cdm_extracted
-    Stores result in orch_data.cdm_decisions
+    Builds the tariff verification prompt.
+    Returns None when a decision was already stored (missing data).
     """
 
     # Extract Required Data
@@ -41,32 +181,56 @@ def tariff_verifier_agent(
     )
 
     if not declaration:
-        orch_data.cdm_decision.append(
-            CDMDecision(
-                risk_id=risk_id,
-                tariff_feedback=TariffFeedback(
-                    status="NEED REVIEW",
-                    explanation="Declaration details are missing; tariff verification could not be performed."
-                )
+        orch_data.cdm_decision = CDMDecision(
+            risk_id=risk_id,
+            tariff_feedback=TariffFeedback(
+                status="NEED REVIEW",
+                explanation="Declaration details are missing; tariff verification could not be performed."
             )
         )
-        return orch_data
+        return None
+
+    # Tariff API circuit open: missing data says nothing about the HS code
+    if tariff_data is None and get_circuit_breaker("tariff").is_open():
+        orch_data.cdm_decision = CDMDecision(
+            risk_id=risk_id,
+            tariff_feedback=TariffFeedback(
+                status="NEED REVIEW",
+                explanation="Tariff reference service is unavailable; tariff verification could not be performed."
+            )
+        )
+        return None
 
     # If Tariff Data Missing
     if tariff_data is None:
-        orch_data.cdm_decision.append(
-            CDMDecision(
-                risk_id=risk_id,
-                tariff_feedback=TariffFeedback(
-                    status="INCORRECT HS CODE",
-                    explanation="No matching tariff data found for the declared HS code; please revalidate the HS code."
-                )
+        orch_data.cdm_decision = CDMDecision(
+            risk_id=risk_id,
+            tariff_feedback=TariffFeedback(
+                status="INCORRECT HS CODE",
+                explanation="No matching tariff data found for the declared HS code; please revalidate the HS code."
             )
         )
-        return orch_data
+        return None
+
+    # Clear matches / mismatches are decided without the LLM
+    if TARIFF_PRECHECK_ENABLED:
+        feedback = _deterministic_tariff_check(declaration, tariff_data, risk_profile)
+        if feedback is not None:
+            orch_data.cdm_decision = CDMDecision(risk_id=risk_id, tariff_feedback=feedback)
+            if is_fused_risk(risk_profile):
+                store_fused_decision(orch_data.cdm_decision, feedback.explanation)
+            return None
+
+    # Fused mode: also ask for the justification of the rule-based decision
+    fused_task = ""
+    if is_fused_risk(risk_profile):
+        fused_task = """
+            - Also write a justification (max 50 words) for the final CDM decision:
+              ACCEPTED → ACCEPTED, INCORRECT HS CODE → INVALID HS CODE
+            """
 
     # Build Prompt
-    prompt = f"""
+    return f"""
             You are a customs tariff verification assistant.
 
             ### USER DECLARATION INPUT
@@ -76,7 +240,7 @@ def tariff_verifier_agent(
             Reason: {risk_profile.risk_description}
 
             ### OFFICIAL TARIFF DATABASE DATA
-            HS Code: {tariff_data.hs_code}
+            HS Code: {tariff_data.hs_code}{_prefix_note(tariff_data)}
             Description: {tariff_data.description}
             Duty Percentage: {tariff_data.duty_percentage}
 
@@ -96,40 +260,307 @@ def tariff_verifier_agent(
             - First evaluate the field mentioned in "Reason"
             - Stop evaluation immediately if the priority field mismatches
             - Explanation must be under 70 words
-
+            {fused_task}
             ### RESPONSE FORMAT
-            Status: <ACCEPTED / INCORRECT HS CODE / DESCRIPTION MISMATCH / DUTY PERCENTAGE MISMATCH>
-            Explanation: <text>
+            {_response_format(risk_profile)}
             """
 
+
+def _response_format(risk_profile: RiskProfile) -> str:
+    if LLM_STRUCTURED_OUTPUT:
+        return json_response_format(_output_model(risk_profile))
+    response_format = (
+        "Status: <ACCEPTED / INCORRECT HS CODE / DESCRIPTION MISMATCH / DUTY PERCENTAGE MISMATCH>\n"
+        "Explanation: <text>"
+    )
+    if is_fused_risk(risk_profile):
+        response_format += "\nJustification: <text>"
+    return response_format
+
+
+def _output_model(risk_profile: RiskProfile):
+    return FusedVerifierOutput if is_fused_risk(risk_profile) else TariffFeedback
+
+
+def _stop_fields(risk_profile: RiskProfile) -> tuple:
+    """Reply fields to wait for before the LLM stream is cut off."""
+    fields = ("Status:", "Explanation:")
+    return fields + ("Justification:",) if is_fused_risk(risk_profile) else fields
+
+
+def _parse_tariff_reply(reply: str) -> Tuple[str, str, Optional[str]]:
+    """Free-text reply → (status, explanation, justification)."""
+    reply, justification = split_justification(reply)
+
+    status = "NEED REVIEW"
+    explanation = reply
+
+    if "Status:" in reply:
+        status = reply.split("Status:")[1].split("\n")[0].strip()
+
+    if "Explanation:" in reply:
+        explanation = reply.split("Explanation:")[1].strip()
+
+    return status, explanation, justification
+
+
+def _structured_tariff_reply(output) -> Tuple[str, str, Optional[str]]:
+    return (
+        output.status.strip().upper(),
+        output.explanation.strip(),
+        getattr(output, "justification", None)
+    )
+
+
+def _call_tariff_llm(prompt: str, risk_profile: RiskProfile) -> Tuple[str, str, Optional[str]]:
+    if LLM_STRUCTURED_OUTPUT:
+        return _structured_tariff_reply(llm_structured(prompt, _output_model(risk_profile)))
+    return _parse_tariff_reply(
+        llm(prompt, stop_fields=_stop_fields(risk_profile), max_words=70).strip()
+    )
+
+
+async def _acall_tariff_llm(prompt: str, risk_profile: RiskProfile) -> Tuple[str, str, Optional[str]]:
+    if LLM_STRUCTURED_OUTPUT:
+        return _structured_tariff_reply(await allm_structured(prompt, _output_model(risk_profile)))
+    return _parse_tariff_reply(
+        (await allm(prompt, stop_fields=_stop_fields(risk_profile), max_words=70)).strip()
+    )
+
+
+def _store_tariff_feedback(
+    orch_data: OrchestratorAgentState,
+    risk_id: Optional[str],
+    status: str,
+    explanation: str
+) -> None:
+    orch_data.cdm_decision = CDMDecision(
+            risk_id=risk_id,
+            tariff_feedback=TariffFeedback(
+                status=status,
+                explanation=explanation
+            )
+    )
+
+
+def _store_tariff_error(
+    orch_data: OrchestratorAgentState,
+    risk_id: Optional[str]
+) -> None:
+    orch_data.cdm_decision = CDMDecision(
+            risk_id=risk_id,
+            tariff_feedback=TariffFeedback(
+                status="NEED REVIEW",
+                explanation="Tariff verification failed due to an internal processing error."
+            )
+        )
+
+
+# Tariff Verifier Agent
+#@agent(name="tariff_verifier_agent", description="Verify tariff details using LLM.")
+def tariff_verifier_agent(
+    orch_data: OrchestratorAgentState,
+    risk_profile: RiskProfile
+) -> None:
+    """
+    Verifies tariff details using LLM.
+    Reads data from orch_data.cdm_extracted
+    Stores result in orch_data.cdm_decisions
+    """
+
+    prompt = _prepare_tariff_prompt(orch_data, risk_profile)
+    if prompt is None:
+        return orch_data
+
     # Call LLM & Parse Response
     try:
-        reply = llm(prompt).strip()
+        status, explanation, justification = _call_tariff_llm(prompt, risk_profile)
+        _store_tariff_feedback(orch_data, risk_profile.risk_id, status, explanation)
+        store_fused_decision(orch_data.cdm_decision, justification)
 
-        status = "NEED REVIEW"
-        explanation = reply
+    except Exception as e:
+        _store_tariff_error(orch_data, risk_profile.risk_id)
 
-        if "Status:" in reply:
-            status = reply.split("Status:")[1].split("\n")[0].strip()
+    return orch_data
 
-        if "Explanation:" in reply:
-            explanation = reply.split("Explanation:")[1].strip()
 
-        orch_data.cdm_decision = CDMDecision(
-                risk_id=risk_id,
-                tariff_feedback=TariffFeedback(
-                    status=status,
-                    explanation=explanation
-                )
+async def atariff_verifier_agent(
+    orch_data: OrchestratorAgentState,
+    risk_profile: RiskProfile
+) -> None:
+    """
+    Async variant of tariff_verifier_agent.
+    """
+
+    prompt = _prepare_tariff_prompt(orch_data, risk_profile)
+    if prompt is None:
+        return orch_data
+
+    try:
+        status, explanation, justification = await _acall_tariff_llm(prompt, risk_profile)
+        _store_tariff_feedback(orch_data, risk_profile.risk_id, status, explanation)
+        store_fused_decision(orch_data.cdm_decision, justification)
+
+    except Exception:
+        _store_tariff_error(orch_data, risk_profile.risk_id)
+
+    return orch_data
+
+
+# BATCHED VERIFICATION (several TARIFF risks of one declaration)
+def _pending_batch_risks(
+    declaration: Optional[DeclarationDetails],
+    tariff_data: Optional[TariffExtractedData],
+    risk_profiles: List[RiskProfile]
+) -> Dict[int, RiskProfile]:
+    """
+    TARIFF risks (by input index) that would reach the LLM one by one.
+    Empty unless batching applies (2+ such risks, data present).
+    """
+    if not TARIFF_BATCH_ENABLED or not declaration or tariff_data is None:
+        return {}
+
+    pending = {
+        index: risk_profile
+        for index, risk_profile in enumerate(risk_profiles)
+        if (risk_profile.risk_type or "").upper().strip() == "TARIFF"
+        and not (
+            TARIFF_PRECHECK_ENABLED
+            and _deterministic_tariff_check(declaration, tariff_data, risk_profile) is not None
         )
+    }
+    return pending if len(pending) > 1 else {}
 
+
+def _batch_tariff_prompt(
+    declaration: DeclarationDetails,
+    tariff_data: TariffExtractedData,
+    pending: Dict[int, RiskProfile]
+) -> str:
+    risks = "\n".join(
+        f"- R{index}: {risk_profile.risk_description}"
+        for index, risk_profile in pending.items()
+    )
+    return f"""
+            You are a customs tariff verification assistant.
+
+            ### USER DECLARATION INPUT
+            HS Code: {declaration.hs_code}
+            Description: {declaration.goods_description}
+            Duty Percentage: {declaration.hs_code_duty_fee}
+
+            ### OFFICIAL TARIFF DATABASE DATA
+            HS Code: {tariff_data.hs_code}{_prefix_note(tariff_data)}
+            Description: {tariff_data.description}
+            Duty Percentage: {tariff_data.duty_percentage}
+
+            ### RISKS (each has its own Reason)
+            {risks}
+
+            ### TASK
+            Verify the declaration SEPARATELY for each risk:
+            1. PRIMARY CHECK — Based ONLY on the field mentioned in that risk's Reason
+            2. SECONDARY CHECK — Only if the priority field matches
+
+            ### STATUS RULES
+            - Description mismatch → DESCRIPTION MISMATCH
+            - Duty mismatch → DUTY PERCENTAGE MISMATCH
+            - HS code mismatch → INCORRECT HS CODE
+            - If all fields match → ACCEPTED
+            - Explanation must be under 70 words
+
+            ### RESPONSE FORMAT
+            {_batch_response_format()}
+            """
+
+
+def _batch_response_format() -> str:
+    if LLM_STRUCTURED_OUTPUT:
+        return (
+            "Respond ONLY with a JSON object {\"results\": [...]} holding one "
+            "{\"risk\": \"R<n>\", \"status\": ..., \"explanation\": ...} object per risk"
+        )
+    return (
+        "JSON array only, one object per risk:\n"
+        '[{"risk": "R<n>", "status": "<ACCEPTED / INCORRECT HS CODE / DESCRIPTION MISMATCH / '
+        'DUTY PERCENTAGE MISMATCH>", "explanation": "<text>"}]'
+    )
+
+
+def _parse_batch_reply(reply: str, pending: Dict[int, RiskProfile]) -> Dict[int, TariffFeedback]:
+    """Per-risk feedback from a free-text reply holding a JSON array."""
+    start, end = reply.find("["), reply.rfind("]")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        items = json.loads(reply[start:end + 1])
+    except ValueError:
+        return {}
+    return _batch_feedbacks(items, pending)
+
+
+def _batch_feedbacks(items, pending: Dict[int, RiskProfile]) -> Dict[int, TariffFeedback]:
+    """Risks missing or malformed in the reply are left out."""
+    feedbacks: Dict[int, TariffFeedback] = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        label = str(item.get("risk", "")).strip().upper().lstrip("R")
+        status = str(item.get("status", "")).strip().upper()
+        explanation = str(item.get("explanation", "")).strip()
+        if not label.isdigit() or int(label) not in pending:
+            continue
+        if status not in TARIFF_STATUSES or not explanation:
+            continue
+        feedbacks[int(label)] = TariffFeedback(status=status, explanation=explanation)
+    return feedbacks
+
+
+def batch_tariff_verifier(
+    declaration: Optional[DeclarationDetails],
+    tariff_data: Optional[TariffExtractedData],
+    risk_profiles: List[RiskProfile]
+) -> Dict[int, TariffFeedback]:
+    """
+    Verifies all ambiguous TARIFF risks of a declaration with ONE LLM call.
+    Returns feedback keyed by index in risk_profiles; any risk not returned
+    (parse failure, LLM error, not batched) falls back to a single-risk call.
+    """
+    pending = _pending_batch_risks(declaration, tariff_data, risk_profiles)
+    if not pending:
+        return {}
+
+    print(f"[TARIFF VERIFIER] Batch verifying {len(pending)} tariff risks")
+    prompt = _batch_tariff_prompt(declaration, tariff_data, pending)
+    try:
+        if LLM_STRUCTURED_OUTPUT:
+            output = llm_structured(prompt, TariffBatchOutput)
+            return _batch_feedbacks([item.model_dump() for item in output.results], pending)
+        return _parse_batch_reply(llm(prompt).strip(), pending)
     except Exception as e:
-        orch_data.cdm_decision = CDMDecision(
-                risk_id=risk_id,
-                tariff_feedback=TariffFeedback(
-                    status="NEED REVIEW",
-                    explanation="Tariff verification failed due to an internal processing error."
-                )
-            )
-        
-    return orch_data
+        print(f"[TARIFF VERIFIER] Batch verification failed: {e}")
+        return {}
+
+
+async def abatch_tariff_verifier(
+    declaration: Optional[DeclarationDetails],
+    tariff_data: Optional[TariffExtractedData],
+    risk_profiles: List[RiskProfile]
+) -> Dict[int, TariffFeedback]:
+    """
+    Async variant of batch_tariff_verifier.
+    """
+    pending = _pending_batch_risks(declaration, tariff_data, risk_profiles)
+    if not pending:
+        return {}
+
+    print(f"[TARIFF VERIFIER] Batch verifying {len(pending)} tariff risks")
+    prompt = _batch_tariff_prompt(declaration, tariff_data, pending)
+    try:
+        if LLM_STRUCTURED_OUTPUT:
+            output = await allm_structured(prompt, TariffBatchOutput)
+            return _batch_feedbacks([item.model_dump() for item in output.results], pending)
+        return _parse_batch_reply((await allm(prompt)).strip(), pending)
+    except Exception as e:
+        print(f"[TARIFF VERIFIER] Batch verification failed: {e}")
+        return {}
@@ -1,7 +1,8 @@
-from typing import Optional
+from typing import Optional, Tuple
 import requests
 
 from src.memory.agentstate import (
+    FusedVerifierOutput,
     ValuationExtractedData,
     ValuationFeedback,
     CDMDecision,
@@ -9,19 +10,31 @@ from src.memory.agentstate import (
     RiskProfile
 )
 #from langgraph.prebuilt import agent
-from src.utils.client_llm import llm
+from src.utils.client_llm import (
+    llm,
+    allm,
+    llm_structured,
+    allm_structured,
+    json_response_format,
+    LLM_STRUCTURED_OUTPUT
+)
+from src.utils.circuit_breaker import get_circuit_breaker
+from src.agents.cdm_decision_agent import (
+    decision_from_status,
+    is_fused_risk,
+    split_justification,
+    store_fused_decision
+)
 
 
-# Valuation Verifier Agent
-#@agent(name="valuation_verifier_agent", description="Verify valuation details using rule-based checks and LLM.")
-def valuation_verifier_agent(
+def _prepare_valuation_prompt(
     orch_data: OrchestratorAgentState,
     risk_profile: RiskProfile
-) -> None:
+) -> Optional[Tuple[str, str]]:
     """
-    Verifies valuation using rule-based checks + LLM explanation.
-    Reads from orch_data.cdm_extracted
-    Assigns CDMDecision into orch_data.cdm_decision
+    Runs the rule-based valuation checks and builds the explanation prompt.
+    Returns (prompt, status), or None when a decision was already stored.
+    In fused mode the prompt also asks for the final decision justification.
     """
 
     risk_id = risk_profile.risk_id
@@ -50,7 +63,18 @@ def valuation_verifier_agent(
                 explanation="Declaration details are missing; valuation verification could not be performed."
             )
         )
-        return
+        return None
+
+    # Valuation API circuit open: missing data says nothing about the HS code
+    if valuation_data is None and get_circuit_breaker("valuation").is_open():
+        orch_data.cdm_decision = CDMDecision(
+            risk_id=risk_id,
+            valuation_feedback=ValuationFeedback(
+                status="NEED REVIEW",
+                explanation="Valuation reference service is unavailable; valuation verification could not be performed."
+            )
+        )
+        return None
 
     if valuation_data is None:
         orch_data.cdm_decision = CDMDecision(
@@ -60,7 +84,7 @@ def valuation_verifier_agent(
                 explanation="No valuation reference data found for the declared HS code; please revalidate."
             )
         )
-        return
+        return None
 
     # Prepare Numeric Values
     try:
@@ -77,7 +101,7 @@ def valuation_verifier_agent(
                 explanation="Invalid numeric values encountered during valuation verification."
             )
         )
-        return
+        return None
 
     db_total_price = db_unit_price * quantity
 
@@ -92,6 +116,16 @@ def valuation_verifier_agent(
     else:
         status = "ACCEPTED"
 
+    # Fused mode: the decision is rule-based too, so ask for both texts at once
+    fused_task = ""
+    if is_fused_risk(risk_profile):
+        final_decision = decision_from_status(status)
+        fused_task = f"""
+            ### FINAL CDM DECISION (ALREADY DETERMINED)
+            Final Decision: {final_decision}
+            Also write a concise technical justification (max 50 words) for the final decision.
+            """
+
     # Build LLM Prompt
     prompt = f"""
             You are a customs valuation verification specialist.
@@ -117,33 +151,134 @@ def valuation_verifier_agent(
             Write a concise technical explanation (<50 words) justifying the above status.
             Do NOT re-calculate values.
             Do NOT change the status.
-
+            {fused_task}
             ### RESPONSE FORMAT
-            Status: {status}
-            Explanation: <text>
+            {_response_format(risk_profile, status)}
             """
 
+    return prompt, status
+
+
+def _response_format(risk_profile: RiskProfile, status: str) -> str:
+    if LLM_STRUCTURED_OUTPUT:
+        return json_response_format(_output_model(risk_profile))
+    response_format = f"Status: {status}\nExplanation: <text>"
+    if is_fused_risk(risk_profile):
+        response_format += "\nJustification: <text>"
+    return response_format
+
+
+def _output_model(risk_profile: RiskProfile):
+    return FusedVerifierOutput if is_fused_risk(risk_profile) else ValuationFeedback
+
+
+def _stop_fields(risk_profile: RiskProfile) -> tuple:
+    """Reply fields to wait for before the LLM stream is cut off."""
+    fields = ("Explanation:",)
+    return fields + ("Justification:",) if is_fused_risk(risk_profile) else fields
+
+
+def _parse_valuation_reply(reply: str) -> Tuple[str, Optional[str]]:
+    """Free-text reply → (explanation, justification)."""
+    reply, justification = split_justification(reply)
+    explanation = reply
+    if "Explanation:" in reply:
+        explanation = reply.split("Explanation:")[1].strip()
+    return explanation, justification
+
+
+def _call_valuation_llm(prompt: str, risk_profile: RiskProfile) -> Tuple[str, Optional[str]]:
+    # The status is rule-based; only the texts are taken from the reply
+    if LLM_STRUCTURED_OUTPUT:
+        output = llm_structured(prompt, _output_model(risk_profile))
+        return output.explanation.strip(), getattr(output, "justification", None)
+    return _parse_valuation_reply(
+        llm(prompt, stop_fields=_stop_fields(risk_profile), max_words=50).strip()
+    )
+
+
+async def _acall_valuation_llm(prompt: str, risk_profile: RiskProfile) -> Tuple[str, Optional[str]]:
+    if LLM_STRUCTURED_OUTPUT:
+        output = await allm_structured(prompt, _output_model(risk_profile))
+        return output.explanation.strip(), getattr(output, "justification", None)
+    return _parse_valuation_reply(
+        (await allm(prompt, stop_fields=_stop_fields(risk_profile), max_words=50)).strip()
+    )
+
+
+def _store_valuation_feedback(
+    orch_data: OrchestratorAgentState,
+    risk_id: Optional[str],
+    status: str,
+    explanation: str
+) -> None:
+    orch_data.cdm_decision = CDMDecision(
+        risk_id=risk_id,
+        valuation_feedback=ValuationFeedback(
+            status=status,
+            explanation=explanation
+        )
+    )
+
+
+def _store_valuation_fallback(
+    orch_data: OrchestratorAgentState,
+    risk_id: Optional[str],
+    status: str
+) -> None:
+    orch_data.cdm_decision = CDMDecision(
+        risk_id=risk_id,
+        valuation_feedback=ValuationFeedback(
+            status=status,
+            explanation="Valuation status determined by rule-based checks; LLM explanation unavailable."
+        )
+    )
+
+
+# Valuation Verifier Agent
+#@agent(name="valuation_verifier_agent", description="Verify valuation details using rule-based checks and LLM.")
+def valuation_verifier_agent(
+    orch_data: OrchestratorAgentState,
+    risk_profile: RiskProfile
+) -> None:
+    """
+    Verifies valuation using rule-based checks + LLM explanation.
+    Reads from orch_data.cdm_extracted
+    Assigns CDMDecision into orch_data.cdm_decision
+    """
+
+    prepared = _prepare_valuation_prompt(orch_data, risk_profile)
+    if prepared is None:
+        return
+    prompt, status = prepared
+
     # Call LLM & Store Decision
     try:
-        reply = llm(prompt).strip()
+        explanation, justification = _call_valuation_llm(prompt, risk_profile)
+        _store_valuation_feedback(orch_data, risk_profile.risk_id, status, explanation)
+        store_fused_decision(orch_data.cdm_decision, justification)
 
-        explanation = reply
-        if "Explanation:" in reply:
-            explanation = reply.split("Explanation:")[1].strip()
+    except Exception:
+        _store_valuation_fallback(orch_data, risk_profile.risk_id, status)
 
-        orch_data.cdm_decision = CDMDecision(
-            risk_id=risk_id,
-            valuation_feedback=ValuationFeedback(
-                status=status,
-                explanation=explanation
-            )
-        )
+
+async def avaluation_verifier_agent(
+    orch_data: OrchestratorAgentState,
+    risk_profile: RiskProfile
+) -> None:
+    """
+    Async variant of valuation_verifier_agent.
+    """
+
+    prepared = _prepare_valuation_prompt(orch_data, risk_profile)
+    if prepared is None:
+        return
+    prompt, status = prepared
+
+    try:
+        explanation, justification = await _acall_valuation_llm(prompt, risk_profile)
+        _store_valuation_feedback(orch_data, risk_profile.risk_id, status, explanation)
+        store_fused_decision(orch_data.cdm_decision, justification)
 
     except Exception:
-        orch_data.cdm_decision = CDMDecision(
-            risk_id=risk_id,
-            valuation_feedback=ValuationFeedback(
-                status=status,
-                explanation="Valuation status determined by rule-based checks; LLM explanation unavailable."
-            )
-        )
+        _store_valuation_fallback(orch_data, risk_profile.risk_id, status)
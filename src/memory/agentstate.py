@@ -18,6 +18,8 @@ class TariffExtractedData(BaseModel):
     hs_code: Optional[str] = None
     description: Optional[str] = None
     duty_percentage: Optional[str] = None
+    # True when the row is the closest tariff entry (prefix / narrower code), not the declared code itself
+    matched_prefix: bool = False
 
 
 class TariffFeedback(BaseModel):
@@ -66,6 +68,9 @@ class CDMExtracted(BaseModel):
     tariff_extracted_data: Optional[TariffExtractedData] = None
     valuation_extracted_data: Optional[ValuationExtractedData] = None
 
+    # Reference sources already looked up (e.g. prefetched once per declaration)
+    resolved_sources: List[str] = Field(default_factory=list)
+
 
 # CDM DECISION
 class CDMDecision(BaseModel):
@@ -80,6 +85,32 @@ class CDMDecision(BaseModel):
     cdm_feedback: Optional[str] = None
 
 
+# LLM STRUCTURED OUTPUT MODELS
+class FusedVerifierOutput(BaseModel):
+    status: str
+    explanation: str
+    justification: str = Field(..., description="Justification of the final CDM decision")
+
+
+class CDMExplanationOutput(BaseModel):
+    explanation: str
+
+
+class CDMDecisionOutput(BaseModel):
+    decision: str = Field(..., description="ACCEPTED / CORRECTION / INSPECTION / DECLINED")
+    explanation: str
+
+
+class TariffBatchItem(BaseModel):
+    risk: str = Field(..., description="Risk label, e.g. R0")
+    status: str
+    explanation: str
+
+
+class TariffBatchOutput(BaseModel):
+    results: List[TariffBatchItem]
+
+
 # ORCHESTRATOR AGENT STATE
 class OrchestratorAgentState(BaseModel):
     """
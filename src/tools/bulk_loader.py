@@ -0,0 +1,305 @@
+import csv
+import io
+import os
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from psycopg2 import sql
+
+# Rows per COPY batch; bounds memory to roughly one chunk of the file
+BULK_LOAD_CHUNK_ROWS = int(os.getenv("BULK_LOAD_CHUNK_ROWS", "50000"))
+
+SWAP = "swap"
+UPSERT = "upsert"
+
+Chunk = List[Tuple[Any, ...]]
+
+
+def normalize_column(name: Any) -> str:
+    """Same column naming as the old DataFrame.to_sql import."""
+    return str(name).strip().lower().replace(" ", "_")
+
+
+def _header(cells: Sequence[Any]) -> List[str]:
+    # Blank header cells keep their position (column_<i>) so data columns don't shift;
+    # only trailing blanks (unused sheet width) are dropped
+    cells = list(cells)
+    while cells and (cells[-1] is None or str(cells[-1]).strip() == ""):
+        cells.pop()
+    return [
+        normalize_column(c) if c is not None and str(c).strip() else f"column_{i}"
+        for i, c in enumerate(cells)
+    ]
+
+
+# READERS (header + chunks of row tuples, never the whole file)
+def _chunked(rows: Iterator[Sequence[Any]], width: int, chunk_rows: int) -> Iterator[Chunk]:
+    chunk: Chunk = []
+    for row in rows:
+        row = tuple(row[:width]) + (None,) * (width - len(row))
+        if all(value is None or value == "" for value in row):
+            continue
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_csv(path: str, chunk_rows: int) -> Tuple[List[str], Iterator[Chunk]]:
+    handle = open(path, newline="", encoding="utf-8-sig")
+    reader = csv.reader(handle)
+    header = _header(next(reader, []))
+
+    def chunks() -> Iterator[Chunk]:
+        with handle:
+            yield from _chunked(reader, len(header), chunk_rows)
+
+    return header, chunks()
+
+
+def _read_xlsx(path: str, chunk_rows: int, sheet: Optional[str]) -> Tuple[List[str], Iterator[Chunk]]:
+    # read_only mode streams rows from the sheet XML instead of building the workbook
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+    rows = worksheet.iter_rows(values_only=True)
+    header = _header(next(rows, ()))
+
+    def chunks() -> Iterator[Chunk]:
+        try:
+            yield from _chunked(rows, len(header), chunk_rows)
+        finally:
+            workbook.close()
+
+    return header, chunks()
+
+
+def read_chunks(
+    path: str,
+    chunk_rows: int = BULK_LOAD_CHUNK_ROWS,
+    sheet: Optional[str] = None
+) -> Tuple[List[str], Iterator[Chunk]]:
+    """Returns (normalized header, iterator of row chunks) for a .csv or .xlsx file."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".csv", ".txt"):
+        return _read_csv(path, chunk_rows)
+    if extension in (".xlsx", ".xlsm"):
+        return _read_xlsx(path, chunk_rows, sheet)
+    raise ValueError(f"Unsupported file type for bulk load: {extension} (use .csv or .xlsx)")
+
+
+# COLUMN TYPES (declared, never sampled)
+def column_types_for(header: List[str], declared: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    TEXT for every column unless declared (e.g. {"duty_fee": "NUMERIC"}).
+    Types are never guessed from a sample: a later chunk with "5%" or "0101"
+    in a column that looked numeric would fail the whole COPY.
+    """
+    declared = declared or {}
+    unknown = set(declared) - set(header)
+    if unknown:
+        raise ValueError(f"column_types names columns not in the file: {', '.join(sorted(unknown))}")
+    return [declared.get(column, "TEXT") for column in header]
+
+
+def _copy_buffer(chunk: Chunk) -> io.StringIO:
+    # Unquoted empty fields are NULL in COPY ... (FORMAT csv)
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(chunk)
+    buffer.seek(0)
+    return buffer
+
+
+class BulkLoader:
+    """
+    Streams a tariff file into Postgres without holding it in memory.
+
+    The file is read in chunks of chunk_rows and each chunk is sent with
+    COPY ... FROM STDIN into a staging table; the live table is only
+    touched at the end, inside the same transaction:
+
+    - swap:   staging becomes the table (rename + drop old) atomically,
+              so readers see either the old or the new data, never none
+    - upsert: rows are merged on key_column and only rows whose values
+              changed are written (delete_missing also removes rows that
+              are no longer in the file)
+
+    Swap-mode columns are TEXT unless given in column_types. Any failure
+    rolls everything back and leaves the live table as it was.
+    """
+
+    def __init__(self, connection: Callable[[], ContextManager[Any]], chunk_rows: int = BULK_LOAD_CHUNK_ROWS):
+        # connection(): context manager yielding a psycopg2 connection that
+        # commits on success and rolls back on error (e.g. database_tool_connection)
+        self.connection = connection
+        self.chunk_rows = chunk_rows
+
+    def load(
+        self,
+        path: str,
+        table_name: str = "tariff_data",
+        mode: str = SWAP,
+        key_column: str = "hscode",
+        delete_missing: bool = False,
+        sheet: Optional[str] = None,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        if mode not in (SWAP, UPSERT):
+            raise ValueError(f"Unknown bulk load mode: {mode}")
+
+        started = time.perf_counter()
+        header, chunks = read_chunks(path, self.chunk_rows, sheet)
+        if not header:
+            raise ValueError(f"No header row in {path}")
+        if mode == UPSERT and key_column not in header:
+            raise ValueError(f"Upsert needs a '{key_column}' column in {path}")
+
+        first = next(chunks, [])
+        if mode == SWAP and not first:
+            raise ValueError(f"{path} has no data rows; refusing to replace '{table_name}' with an empty table")
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                staging = f"{table_name}_staging"
+                if mode == SWAP:
+                    self._create_staging(cur, staging, header, column_types_for(header, column_types))
+                else:
+                    self._create_staging_like(cur, staging, table_name)
+
+                rows = self._copy(cur, staging, header, first, chunks)
+
+                if mode == SWAP:
+                    changed = rows
+                    self._swap(cur, table_name, staging, key_column if key_column in header else None)
+                else:
+                    changed = self._upsert(cur, table_name, staging, header, key_column, delete_missing)
+
+        elapsed = time.perf_counter() - started
+        return {
+            "table": table_name,
+            "mode": mode,
+            "rows": rows,
+            "changed": changed,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(rows / elapsed) if elapsed else None,
+        }
+
+    # STAGING
+    def _create_staging(self, cur, staging: str, header: List[str], types: List[str]) -> None:
+        columns = sql.SQL(", ").join(
+            sql.SQL("{} {}").format(sql.Identifier(c), sql.SQL(t)) for c, t in zip(header, types)
+        )
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(staging)))
+        cur.execute(sql.SQL("CREATE TABLE {} ({})").format(sql.Identifier(staging), columns))
+
+    def _create_staging_like(self, cur, staging: str, table_name: str) -> None:
+        # Temp copy of the live table's columns, so COPY casts to the real types
+        cur.execute(
+            sql.SQL("CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP").format(
+                sql.Identifier(staging), sql.Identifier(table_name)
+            )
+        )
+
+    def _copy(self, cur, staging: str, header: List[str], first: Chunk, rest: Iterator[Chunk]) -> int:
+        statement = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+            sql.Identifier(staging), sql.SQL(", ").join(map(sql.Identifier, header))
+        ).as_string(cur)
+
+        rows = 0
+        chunk = first
+        while chunk:
+            cur.copy_expert(statement, _copy_buffer(chunk))
+            rows += len(chunk)
+            chunk = next(rest, None)
+        return rows
+
+    # FINALIZE
+    def _swap(self, cur, table_name: str, staging: str, key_column: Optional[str]) -> None:
+        if key_column:
+            # Built after the load: one sort instead of per-row index maintenance
+            cur.execute(
+                sql.SQL("CREATE INDEX {} ON {} ({})").format(
+                    sql.Identifier(f"{staging}_{key_column}_idx"),
+                    sql.Identifier(staging),
+                    sql.Identifier(key_column)
+                )
+            )
+        cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(staging)))
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table_name)))
+        cur.execute(
+            sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(staging), sql.Identifier(table_name))
+        )
+        if key_column:
+            cur.execute(
+                sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                    sql.Identifier(f"{staging}_{key_column}_idx"),
+                    sql.Identifier(f"{table_name}_{key_column}_idx")
+                )
+            )
+
+    def _upsert(
+        self,
+        cur,
+        table_name: str,
+        staging: str,
+        header: List[str],
+        key_column: str,
+        delete_missing: bool
+    ) -> int:
+        table, stage, key = sql.Identifier(table_name), sql.Identifier(staging), sql.Identifier(key_column)
+        columns = sql.SQL(", ").join(map(sql.Identifier, header))
+        values = [c for c in header if c != key_column]
+
+        # ON CONFLICT needs a unique index on the key
+        self._check_unique_key(cur, table_name, key_column)
+        cur.execute(
+            sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})").format(
+                sql.Identifier(f"{table_name}_{key_column}_key"), table, key
+            )
+        )
+
+        if values:
+            conflict = sql.SQL("DO UPDATE SET ({}) = ROW({}) WHERE ({}) IS DISTINCT FROM ({})").format(
+                sql.SQL(", ").join(map(sql.Identifier, values)),
+                sql.SQL(", ").join(sql.SQL("EXCLUDED.{}").format(sql.Identifier(c)) for c in values),
+                sql.SQL(", ").join(sql.SQL("{}.{}").format(table, sql.Identifier(c)) for c in values),
+                sql.SQL(", ").join(sql.SQL("EXCLUDED.{}").format(sql.Identifier(c)) for c in values),
+            )
+        else:
+            conflict = sql.SQL("DO NOTHING")
+
+        # DISTINCT ON: a key repeated in the file is written once
+        cur.execute(
+            sql.SQL(
+                "INSERT INTO {table} ({columns}) "
+                "SELECT DISTINCT ON ({key}) {columns} FROM {stage} WHERE {key} IS NOT NULL ORDER BY {key} "
+                "ON CONFLICT ({key}) {conflict}"
+            ).format(table=table, columns=columns, key=key, stage=stage, conflict=conflict)
+        )
+        changed = cur.rowcount
+
+        if delete_missing:
+            cur.execute(
+                sql.SQL("DELETE FROM {table} t WHERE NOT EXISTS (SELECT 1 FROM {stage} s WHERE s.{key} = t.{key})")
+                .format(table=table, stage=stage, key=key)
+            )
+            changed += cur.rowcount
+        return changed
+
+    def _check_unique_key(self, cur, table_name: str, key_column: str) -> None:
+        # Only needed the first time: once the unique index exists duplicates can't appear
+        cur.execute("SELECT to_regclass(%s)", (f"{table_name}_{key_column}_key",))
+        if cur.fetchone()[0] is not None:
+            return
+        cur.execute(
+            sql.SQL("SELECT {key} FROM {table} WHERE {key} IS NOT NULL GROUP BY {key} HAVING COUNT(*) > 1 LIMIT 5")
+            .format(key=sql.Identifier(key_column), table=sql.Identifier(table_name))
+        )
+        duplicates = [str(row[0]) for row in cur.fetchall()]
+        if duplicates:
+            raise ValueError(
+                f"Cannot upsert into '{table_name}': '{key_column}' is not unique in the table "
+                f"(e.g. {', '.join(duplicates)}). Reload it with mode='swap' or remove the duplicates first."
+            )
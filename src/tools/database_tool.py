@@ -1,32 +1,67 @@
-import pandas as pd
-from sqlalchemy import create_engine, text
-import os
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor
+
+from src.tools.bulk_loader import BulkLoader, SWAP
+from src.tools.db_connector import database_tool_connection
+
+# Rows fetched per round trip when streaming a table
+ITER_ROWS_BATCH = 2000
 
 
 class DatabaseTool:
-    def __init__(self):
-        db_user = os.getenv("DB_USER", "postgres")
-        db_pass = os.getenv("DB_PASS", "2323")
-        db_host = os.getenv("DB_HOST", "localhost")
-        db_port = os.getenv("DB_PORT", "5432")
-        db_name = os.getenv("DB_NAME", "tariff_db")
-
-        self.engine = create_engine(
-            f"postgresql+psycopg2://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
-        )
+    """Tariff table access (DB_* database); every query borrows a connection from its shared pool."""
 
-    def import_excel_to_db(self, excel_path: str, table_name="tariff_data"):
-        """Load Excel into PostgreSQL"""
-        df = pd.read_excel(excel_path)
-        df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
-        df.to_sql(table_name, self.engine, if_exists="replace", index=False)
-        print(f"✅ Imported {len(df)} rows into '{table_name}' table")
+    def import_excel_to_db(self, excel_path: str, table_name="tariff_data", mode=SWAP, **kwargs):
+        """Load Excel / CSV into PostgreSQL (chunked COPY, atomic swap or upsert)"""
+        result = BulkLoader(database_tool_connection).load(excel_path, table_name=table_name, mode=mode, **kwargs)
+        print(
+            f"✅ Imported {result['rows']} rows into '{table_name}' table "
+            f"({result['mode']}, {result['changed']} changed, {result['rows_per_sec']} rows/s)"
+        )
+        return result
 
     def get_row_by_hscode(self, input_hscode: str, table_name="tariff_data"):
         """Retrieve a row by HSCode"""
-        query = text(f"SELECT * FROM {table_name} WHERE hscode = :hscode")
-        with self.engine.connect() as conn:
-            result = conn.execute(query, {"hscode": input_hscode}).fetchone()
-        if result:
-            return dict(result._mapping)
-        return None
+        query = sql.SQL("SELECT * FROM {} WHERE hscode = %s").format(sql.Identifier(table_name))
+        with database_tool_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, (input_hscode,))
+                result = cur.fetchone()
+        return dict(result) if result else None
+
+    def iter_rows(self, table_name="tariff_data"):
+        """Stream every row of a table as dicts (server-side cursor)"""
+        query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(table_name))
+        with database_tool_connection() as conn:
+            with conn.cursor(name=f"iter_{table_name}", cursor_factory=RealDictCursor) as cur:
+                cur.itersize = ITER_ROWS_BATCH
+                cur.execute(query)
+                for row in cur:
+                    yield dict(row)
+
+    def table_signature(self, table_name="tariff_data"):
+        """Cheap change marker: table oid + insert/update/delete counters"""
+        query = """
+            SELECT c.oid,
+                   COALESCE(s.n_tup_ins, 0),
+                   COALESCE(s.n_tup_upd, 0),
+                   COALESCE(s.n_tup_del, 0)
+            FROM pg_class c
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE c.oid = to_regclass(%s)
+            """
+        with database_tool_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (table_name,))
+                result = cur.fetchone()
+        return tuple(result) if result else None
+
+    def lookup_hscode(self, input_hscode: str, min_digits: int = 2):
+        """Retrieve the best tariff_data row from the in-memory HS code index"""
+        from src.tools.hs_code_index import get_hs_code_index
+        index = get_hs_code_index()
+        if not index.loaded:
+            # Outside the API nothing starts the index; load it once here
+            index.reload()
+        match = index.lookup(input_hscode, min_digits=min_digits)
+        return dict(match.row) if match else None
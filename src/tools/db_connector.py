@@ -1,23 +1,411 @@
 import psycopg2
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Connection pool settings (shared by both databases)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+DB_POOL_VALIDATE_AFTER = float(os.getenv("DB_POOL_VALIDATE_AFTER", "30"))
+DB_POOL_RECYCLE_INTERVAL = float(os.getenv("DB_POOL_RECYCLE_INTERVAL", "60"))
 
-def get_tariff_connection(test: bool = False):
-    try:
-        conn = psycopg2.connect(
-            dbname=os.getenv("TARIFF_DATABASE_NAME"),
-            user=os.getenv("TARIFF_DATABASE_USER"),
-            password=os.getenv("TARIFF_DATABASE_PASSWORD"),
-            host=os.getenv("TARIFF_DATABASE_HOST"),
-            port=os.getenv("TARIFF_DATABASE_PORT"),
+# pool name → env prefix of its connection settings
+DB_POOL_PREFIXES = {
+    "tariff": "TARIFF",
+    "valuation": "EVALUATION",
+    # DatabaseTool's own database (tariff_data imports, HS index, snapshot
+    # table sync): still its original DB_* settings, never TARIFF_DATABASE_*
+    "database_tool": "DB",
+}
+
+# DB_* names and defaults, as DatabaseTool always read them
+_DB_TOOL_SETTINGS = {
+    "NAME": ("DB_NAME", "tariff_db"),
+    "USER": ("DB_USER", "postgres"),
+    "PASSWORD": ("DB_PASS", "2323"),
+    "HOST": ("DB_HOST", "localhost"),
+    "PORT": ("DB_PORT", "5432"),
+}
+
+
+def _setting(prefix: str, key: str) -> Optional[str]:
+    if prefix == "DB":
+        env, default = _DB_TOOL_SETTINGS[key]
+        return os.getenv(env, default)
+    return os.getenv(f"{prefix}_DATABASE_{key}")
+
+
+def _configured(prefix: str) -> bool:
+    env = _DB_TOOL_SETTINGS["HOST"][0] if prefix == "DB" else f"{prefix}_DATABASE_HOST"
+    return bool(os.getenv(env))
+
+
+def _describe(prefix: str) -> str:
+    """user@host:port/dbname of a pool's database (no password), for logs."""
+    return (
+        f"{_setting(prefix, 'USER')}@{_setting(prefix, 'HOST')}:"
+        f"{_setting(prefix, 'PORT')}/{_setting(prefix, 'NAME')}"
+    )
+
+
+def _connect(prefix: str):
+    return psycopg2.connect(
+        dbname=_setting(prefix, "NAME"),
+        user=_setting(prefix, "USER"),
+        password=_setting(prefix, "PASSWORD"),
+        host=_setting(prefix, "HOST"),
+        port=_setting(prefix, "PORT"),
+    )
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the checkout timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class PostgresPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    - keeps at least min_size connections open, never more than max_size
+    - checkout waits up to timeout seconds for a free connection (PoolTimeout)
+    - a connection idle for longer than validate_after is checked with
+      SELECT 1 before it is handed out; broken ones are replaced
+    - connections idle longer than max_idle or older than max_lifetime are
+      closed instead of reused (recycle_idle() trims them down to min_size)
+    - on return, any open transaction is rolled back
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connect: Callable[[], Any],
+        min_size: int = DB_POOL_MIN,
+        max_size: int = DB_POOL_MAX,
+        timeout: float = DB_POOL_TIMEOUT,
+        max_idle: float = DB_POOL_MAX_IDLE,
+        max_lifetime: float = DB_POOL_MAX_LIFETIME,
+        validate_after: float = DB_POOL_VALIDATE_AFTER
+    ):
+        self.name = name
+        self._connect = connect
+        self.max_size = max(1, max_size)
+        self.min_size = min(max(0, min_size), self.max_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.validate_after = validate_after
+
+        self._cond = threading.Condition()
+        self._idle: List[_PooledConnection] = []
+        self._checked_out: Dict[int, _PooledConnection] = {}
+        self._size = 0
+        self._closed = False
+        self._counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "validation_failures": 0,
+        }
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(self.min_size):
+            self._size += 1
+            self._idle.append(self._open())
+
+    # INTERNALS
+    def _open(self) -> _PooledConnection:
+        """Fills a reserved slot; frees the slot again if connecting fails."""
+        try:
+            pooled = _PooledConnection(self._connect())
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters["created"] += 1
+        return pooled
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _expired(self, pooled: _PooledConnection, now: float) -> bool:
+        return (
+            now - pooled.created_at > self.max_lifetime
+            or now - pooled.last_used > self.max_idle
         )
 
-        print("---> Tariff database connected successfully!")
+    def _is_valid(self, pooled: _PooledConnection, now: float) -> bool:
+        if pooled.conn.closed:
+            return False
+        if now - pooled.last_used < self.validate_after:
+            return True
+        try:
+            with pooled.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            pooled.conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _take(self) -> Optional[_PooledConnection]:
+        """
+        Pops an idle connection, or reserves a slot for a new one (returns
+        None), waiting up to timeout for either.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"{self.name} pool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"{self.name} pool exhausted ({self.max_size} connections in use)"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._counters["checkouts"] += 1
+            if waited:
+                elapsed = time.monotonic() - started
+                self._counters["waits"] += 1
+                self._wait_total += elapsed
+                self._wait_max = max(self._wait_max, elapsed)
+        return pooled
+
+    # PUBLIC API
+    def getconn(self):
+        """Checks out a validated connection; hand it back with putconn()."""
+        while True:
+            pooled = self._take()
+            if pooled is None:
+                pooled = self._open()
+                break
+
+            now = time.monotonic()
+            if self._expired(pooled, now):
+                with self._cond:
+                    self._counters["recycled"] += 1
+                self._discard(pooled)
+                continue
+            if not self._is_valid(pooled, now):
+                with self._cond:
+                    self._counters["validation_failures"] += 1
+                self._discard(pooled)
+                continue
+            break
+
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._checked_out[id(pooled.conn)] = pooled
+        return pooled.conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        with self._cond:
+            pooled = self._checked_out.pop(id(conn), None)
+        if pooled is None:
+            raise ValueError(f"Connection was not checked out from the {self.name} pool")
+
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()  # never hand out a connection mid-transaction
+            except Exception:
+                discard = True
+
+        if discard or conn.closed or self._closed:
+            self._discard(pooled)
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        with pool.connection() as conn: ...
+        Commits on success and rolls back on error; connections that broke
+        during the block are closed instead of returned to the pool.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        self.putconn(conn)
+
+    def recycle_idle(self) -> int:
+        """Closes idle connections past max_idle / max_lifetime, keeping min_size."""
+        now = time.monotonic()
+        with self._cond:
+            surplus = max(0, self._size - self.min_size)
+            expired = [p for p in self._idle if self._expired(p, now)][:surplus]
+            for pooled in expired:
+                self._idle.remove(pooled)
+            self._counters["recycled"] += len(expired)
+        for pooled in expired:
+            self._discard(pooled)
+        return len(expired)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            in_use = len(self._checked_out)
+            waits = self._counters["waits"]
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "utilization": round(in_use / self.max_size, 3),
+                "wait_avg": round(self._wait_total / waits, 4) if waits else 0.0,
+                "wait_max": round(self._wait_max, 4),
+                **self._counters,
+            }
+
+
+# SHARED POOLS
+_pools: Dict[str, PostgresPool] = {}
+_pools_lock = threading.Lock()
+_recycler_stop = threading.Event()
+_recycler: Optional[threading.Thread] = None
+
+
+def _recycle_loop() -> None:
+    while not _recycler_stop.wait(DB_POOL_RECYCLE_INTERVAL):
+        with _pools_lock:
+            pools = list(_pools.values())
+        for pool in pools:
+            pool.recycle_idle()
+
+
+def get_db_pool(name: str) -> PostgresPool:
+    """Shared pool for "tariff" / "valuation" (created on first use if not at startup)."""
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            prefix = DB_POOL_PREFIXES[name]
+            pool = _pools[name] = PostgresPool(name, lambda: _connect(prefix))
+            print(f"---> {name} DB pool: {_describe(prefix)}")
+        return pool
+
+
+def init_db_pools() -> None:
+    """Creates the pools whose database is configured, plus the idle recycler."""
+    global _recycler
+    for name, prefix in DB_POOL_PREFIXES.items():
+        if not _configured(prefix):
+            continue
+        try:
+            get_db_pool(name)
+        except Exception as e:
+            print(f"---> Failed to create {name} DB pool: {e}")
+
+    if _recycler is None and DB_POOL_RECYCLE_INTERVAL > 0:
+        _recycler_stop.clear()
+        _recycler = threading.Thread(target=_recycle_loop, name="db-pool-recycler", daemon=True)
+        _recycler.start()
+
+
+def close_db_pools() -> None:
+    global _recycler
+    _recycler_stop.set()
+    if _recycler is not None:
+        _recycler.join(timeout=1)
+        _recycler = None
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def db_pool_stats() -> Dict[str, Dict[str, Any]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.stats() for pool in pools}
+
+
+@contextmanager
+def tariff_connection():
+    """with tariff_connection() as conn: ... (pooled)"""
+    with get_db_pool("tariff").connection() as conn:
+        yield conn
+
+
+@contextmanager
+def valuation_connection():
+    """with valuation_connection() as conn: ... (pooled)"""
+    with get_db_pool("valuation").connection() as conn:
+        yield conn
+
+
+@contextmanager
+def database_tool_connection():
+    """with database_tool_connection() as conn: ... (pooled, DB_* settings)"""
+    with get_db_pool("database_tool").connection() as conn:
+        yield conn
+
+
+# Unpooled connections (caller closes them); prefer the pools above
+def get_tariff_connection(test: bool = False):
+    try:
+        conn = _connect("TARIFF")
 
         if test:
+            print("---> Tariff database connected successfully!")
             with conn.cursor() as cur:
                 cur.execute("SELECT NOW();")
                 print("---> Tariff DB Time:", cur.fetchone()[0])
@@ -32,17 +420,10 @@ def get_tariff_connection(test: bool = False):
 
 def get_valuation_connection(test: bool = False):
     try:
-        conn = psycopg2.connect(
-            dbname=os.getenv("EVALUATION_DATABASE_NAME"),
-            user=os.getenv("EVALUATION_DATABASE_USER"),
-            password=os.getenv("EVALUATION_DATABASE_PASSWORD"),
-            host=os.getenv("EVALUATION_DATABASE_HOST"),
-            port=os.getenv("EVALUATION_DATABASE_PORT"),
-        )
-
-        print("---> Valuation database connected successfully!")
+        conn = _connect("EVALUATION")
 
         if test:
+            print("---> Valuation database connected successfully!")
             with conn.cursor() as cur:
                 cur.execute("SELECT NOW();")
                 print("---> Valuation DB Time:", cur.fetchone()[0])
@@ -1,18 +1,40 @@
+import os
+import httpx
 import requests
 from typing import Optional
 from src.memory.agentstate import DeclarationDetails
+from src.utils.circuit_breaker import get_circuit_breaker, CircuitOpenError
+from src.utils.single_flight import get_single_flight
+from src.utils.http_client import (
+    get_session,
+    get_async_client,
+    timeout_for,
+    async_timeout_for
+)
 from config import GRAPHQL_URL
 #from langchain.tools import tool
 
+DECLARATION_TIMEOUT = float(os.getenv("DECLARATION_TIMEOUT", "10"))
 
-#@tool(description="Fetch declaration details from the database using the declaration ID")
-def fetch_declaration_details(declaration_id: str) -> Optional[DeclarationDetails]:
+# Fails fast (→ None) while the GraphQL service is known to be down
+_graphql_breaker = get_circuit_breaker("graphql")
+
+def _is_upstream_failure(e: Exception) -> bool:
+    # A 4xx reply (e.g. unknown declaration id) means the service is up;
+    # only connection errors, timeouts and 5xx count against the breaker
+    response = getattr(e, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is None or status >= 500
 
-    headers = {
-        "Content-Type": "application/json"
-    }
 
-    query = """
+# Concurrent lookups of the same declaration share one GraphQL request
+_declaration_flight = get_single_flight("declaration")
+
+DECLARATION_HEADERS = {
+    "Content-Type": "application/json"
+}
+
+DECLARATION_QUERY = """
     query ($declaration_id: String!) {
       declaration_versioned_list(declaration_id: $declaration_id) {
         versioned_data
@@ -20,21 +42,69 @@ def fetch_declaration_details(declaration_id: str) -> Optional[DeclarationDetail
     }
     """
 
-    payload = {
-        "query": query,
+
+def _declaration_payload(declaration_id: str) -> dict:
+    return {
+        "query": DECLARATION_QUERY,
         "variables": {
             "declaration_id": declaration_id
         }
     }
 
+
+#@tool(description="Fetch declaration details from the database using the declaration ID")
+def fetch_declaration_details(declaration_id: str) -> Optional[DeclarationDetails]:
+    return _declaration_flight.do(
+        declaration_id, lambda: _fetch_declaration_details(declaration_id)
+    )
+
+
+async def afetch_declaration_details(declaration_id: str) -> Optional[DeclarationDetails]:
+    return await _declaration_flight.ado(
+        declaration_id, lambda: _afetch_declaration_details(declaration_id)
+    )
+
+
+def _fetch_declaration_details(declaration_id: str) -> Optional[DeclarationDetails]:
+
     try:
-        response = requests.post(GRAPHQL_URL, headers=headers, json=payload, timeout=10)
-        response.raise_for_status()
-    except requests.RequestException as e:
+        with _graphql_breaker.guard(_is_upstream_failure):
+            response = get_session().post(
+                GRAPHQL_URL,
+                headers=DECLARATION_HEADERS,
+                json=_declaration_payload(declaration_id),
+                timeout=timeout_for(DECLARATION_TIMEOUT)
+            )
+            response.raise_for_status()
+    except (requests.RequestException, CircuitOpenError) as e:
         print(f"\n---> Declaration API request failed: {e}")
         return None
 
-    data = response.json()
+    return _parse_declaration_response(declaration_id, response.json())
+
+
+async def _afetch_declaration_details(declaration_id: str) -> Optional[DeclarationDetails]:
+
+    try:
+        with _graphql_breaker.guard(_is_upstream_failure):
+            response = await get_async_client().post(
+                GRAPHQL_URL,
+                headers=DECLARATION_HEADERS,
+                json=_declaration_payload(declaration_id),
+                timeout=async_timeout_for(DECLARATION_TIMEOUT)
+            )
+            response.raise_for_status()
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        print(f"\n---> Declaration API request failed: {e}")
+        return None
+
+    return _parse_declaration_response(declaration_id, response.json())
+
+
+def _parse_declaration_response(
+    declaration_id: str,
+    data: dict
+) -> Optional[DeclarationDetails]:
 
     # Defensive Checks
     if not data.get("data"):
@@ -0,0 +1,262 @@
+import bisect
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from src.utils.hs_code import normalize_hs_code
+
+# tariff_data columns (as written by DatabaseTool.import_excel_to_db)
+HS_CODE_COLUMN = os.getenv("HS_INDEX_CODE_COLUMN", "hscode")
+HS_DESCRIPTION_COLUMN = os.getenv("HS_INDEX_DESCRIPTION_COLUMN", "goods_description")
+HS_DUTY_COLUMN = os.getenv("HS_INDEX_DUTY_COLUMN", "duty_fee")
+
+HS_INDEX_ENABLED = os.getenv("HS_INDEX_ENABLED", "false").lower() == "true"
+HS_INDEX_TABLE = os.getenv("HS_INDEX_TABLE", "tariff_data")
+HS_INDEX_REFRESH_INTERVAL = float(os.getenv("HS_INDEX_REFRESH_INTERVAL", "300"))
+# First retry after a failed load; doubles up to HS_INDEX_REFRESH_INTERVAL
+HS_INDEX_RETRY_MIN = float(os.getenv("HS_INDEX_RETRY_MIN", "5"))
+# Shortest prefix the tariff retriever accepts as a match (6 = subheading)
+HS_INDEX_MIN_DIGITS = int(os.getenv("HS_INDEX_MIN_DIGITS", "6"))
+
+# Prefix levels tried after an exact miss, each shorter than the declared code:
+# national line(10), national subheading(8), HS subheading(6), heading(4), chapter(2)
+HS_PREFIX_LEVELS = (10, 8, 6, 4, 2)
+
+Row = Dict[str, Any]
+
+
+class HSCodeMatch:
+    __slots__ = ("row", "code", "match")
+
+    def __init__(self, row: Row, code: str, match: str):
+        self.row = row
+        self.code = code      # normalized code of the matched row
+        self.match = match    # "exact" / "prefix" (row is broader) / "extension" (row is narrower)
+
+    def __repr__(self) -> str:
+        return f"HSCodeMatch(code={self.code!r}, match={self.match!r})"
+
+
+class _Snapshot:
+    """Immutable sorted arrays; replaced as a whole on reload."""
+
+    __slots__ = ("codes", "rows", "signature", "loaded_at")
+
+    def __init__(self, codes: List[str], rows: List[Row], signature: Hashable):
+        self.codes = codes
+        self.rows = rows
+        self.signature = signature
+        self.loaded_at = time.time()
+
+
+class HSCodeIndex:
+    """
+    In-memory HS code index: a sorted array of normalized codes with the
+    matching tariff rows alongside.
+
+    lookup() tries an exact match, then the longest table code that is a
+    prefix of the declared code (10 → 8 → 6 → 4 → 2 digits), then the
+    first table code that extends a less specific declared code. All
+    lookups are binary searches over the current snapshot; reload() builds
+    a new snapshot and swaps it in with one assignment, so readers never
+    see a half-loaded index.
+
+    Lookups never load: until the first load succeeds they return None
+    (counted as "unloaded") and callers fall back to the snapshot / API,
+    while the refresh thread keeps retrying with backoff.
+    """
+
+    def __init__(
+        self,
+        load_rows: Callable[[], Iterable[Row]],
+        load_signature: Optional[Callable[[], Hashable]] = None,
+        code_column: str = HS_CODE_COLUMN
+    ):
+        self._load_rows = load_rows
+        self._load_signature = load_signature
+        self.code_column = code_column
+        self._snapshot: Optional[_Snapshot] = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+        self._last_error: Optional[str] = None
+        self._counters = {
+            "lookups": 0, "exact": 0, "prefix": 0, "extension": 0, "misses": 0, "unloaded": 0,
+            "reloads": 0, "failed_reloads": 0,
+        }
+
+    # LOADING
+    def reload(self) -> int:
+        """Rebuilds the index from the table; returns the number of codes."""
+        with self._reload_lock:
+            signature = self._load_signature() if self._load_signature else None
+            by_code: Dict[str, Row] = {}
+            for row in self._load_rows():
+                code = normalize_hs_code(row.get(self.code_column))
+                if code and code not in by_code:  # first row wins on duplicates
+                    by_code[code] = row
+            codes = sorted(by_code)
+            self._snapshot = _Snapshot(codes, [by_code[code] for code in codes], signature)
+            self._counters["reloads"] += 1
+            return len(codes)
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def refresh_if_changed(self) -> bool:
+        """Reloads when the table signature changed (or nothing is loaded yet)."""
+        snapshot = self._snapshot
+        if snapshot is not None and self._load_signature is not None:
+            if self._load_signature() == snapshot.signature:
+                return False
+        self.reload()
+        return True
+
+    def _try_refresh(self) -> bool:
+        """refresh_if_changed() that logs instead of raising; False on failure."""
+        try:
+            if self.refresh_if_changed():
+                print(f"[HS INDEX] Loaded {len(self)} codes")
+            self._last_error = None
+            return True
+        except Exception as e:
+            self._last_error = str(e)
+            self._counters["failed_reloads"] += 1
+            if self.loaded:
+                print(f"[HS INDEX] Refresh failed, keeping current index: {e}")
+            else:
+                print(f"[HS INDEX] Load failed, tariff lookups use the snapshot / API: {e}")
+            return False
+
+    def _refresh_loop(self) -> None:
+        retry = HS_INDEX_RETRY_MIN
+        delay = HS_INDEX_REFRESH_INTERVAL if self._last_error is None else retry
+        while not self._stop.wait(delay):
+            if self._try_refresh():
+                if HS_INDEX_REFRESH_INTERVAL <= 0:
+                    return  # polling disabled: the thread only existed to finish the first load
+                retry = HS_INDEX_RETRY_MIN
+                delay = HS_INDEX_REFRESH_INTERVAL
+            else:
+                delay = retry
+                retry = min(retry * 2, max(HS_INDEX_REFRESH_INTERVAL, HS_INDEX_RETRY_MIN))
+
+    def start(self) -> None:
+        """
+        Loads the index and starts polling the table for changes. A failed
+        load is logged, not raised: the refresh thread retries it with backoff.
+        """
+        self._try_refresh()
+        if self._refresher is None and (HS_INDEX_REFRESH_INTERVAL > 0 or not self.loaded):
+            self._stop.clear()
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="hs-index-refresh", daemon=True
+            )
+            self._refresher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=1)
+            self._refresher = None
+
+    def _current(self) -> Optional[_Snapshot]:
+        # Never loads on the request path; None until the first load succeeds
+        snapshot = self._snapshot
+        if snapshot is None:
+            self._counters["unloaded"] += 1
+        return snapshot
+
+    # LOOKUPS
+    def get(self, hs_code: str) -> Optional[Row]:
+        """Exact match on the normalized code."""
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        code = normalize_hs_code(hs_code)
+        i = bisect.bisect_left(snapshot.codes, code)
+        if code and i < len(snapshot.codes) and snapshot.codes[i] == code:
+            return snapshot.rows[i]
+        return None
+
+    def lookup(self, hs_code: str, min_digits: int = 2) -> Optional[HSCodeMatch]:
+        """
+        Exact, then longest-prefix (never shorter than min_digits), then the
+        first narrower code under the declared one.
+        """
+        self._counters["lookups"] += 1
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        codes = snapshot.codes
+        code = normalize_hs_code(hs_code)
+        if not code:
+            self._counters["misses"] += 1
+            return None
+
+        levels = (len(code),) + tuple(n for n in HS_PREFIX_LEVELS if n < len(code))
+        for length in levels:
+            if length < min_digits:
+                break
+            prefix = code[:length]
+            i = bisect.bisect_left(codes, prefix)
+            if i < len(codes) and codes[i] == prefix:
+                match = "exact" if length == len(code) else "prefix"
+                self._counters[match] += 1
+                return HSCodeMatch(snapshot.rows[i], prefix, match)
+
+        # Declared code less specific than the table: first code under it
+        i = bisect.bisect_left(codes, code)
+        if i < len(codes) and codes[i].startswith(code) and len(code) >= min_digits:
+            self._counters["extension"] += 1
+            return HSCodeMatch(snapshot.rows[i], codes[i], "extension")
+
+        self._counters["misses"] += 1
+        return None
+
+    def under(self, prefix: str, limit: int = 100) -> List[Row]:
+        """All rows whose code starts with prefix (e.g. every code in a chapter)."""
+        snapshot = self._current()
+        if snapshot is None:
+            return []
+        code = normalize_hs_code(prefix)
+        start = bisect.bisect_left(snapshot.codes, code)
+        end = bisect.bisect_left(snapshot.codes, code + "\x7f", lo=start)
+        return snapshot.rows[start:min(end, start + limit)]
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        return len(snapshot.codes) if snapshot else 0
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "codes": len(snapshot.codes) if snapshot else 0,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "signature": str(snapshot.signature) if snapshot else None,
+            "last_error": self._last_error,
+            **self._counters,
+        }
+
+
+# SHARED INDEX OVER tariff_data
+_hs_code_index: Optional[HSCodeIndex] = None
+_hs_code_index_lock = threading.Lock()
+
+
+def get_hs_code_index() -> HSCodeIndex:
+    """Process-wide index over HS_INDEX_TABLE (read through the DatabaseTool pool)."""
+    global _hs_code_index
+    if _hs_code_index is None:
+        with _hs_code_index_lock:
+            if _hs_code_index is None:
+                # Deferred: the DB driver / pool are only needed once the index is used
+                from src.tools.database_tool import DatabaseTool
+                db = DatabaseTool()
+                _hs_code_index = HSCodeIndex(
+                    load_rows=lambda: db.iter_rows(HS_INDEX_TABLE),
+                    load_signature=lambda: db.table_signature(HS_INDEX_TABLE)
+                )
+    return _hs_code_index
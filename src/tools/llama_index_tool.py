@@ -1,5 +1,11 @@
 from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext, load_index_from_storage
+from concurrent.futures import ThreadPoolExecutor
 import os
+import threading
+
+# Parallel queries per query_many() call
+LLAMA_QUERY_WORKERS = int(os.getenv("LLAMA_QUERY_WORKERS", "4"))
+
 #from langchain.tools import tool
 #@tool(description="Llama Index Tool for building and querying tariff data index")
 class LlamaIndexTool:
@@ -7,6 +13,12 @@ class LlamaIndexTool:
         self.persist_dir = persist_dir
         os.makedirs(persist_dir, exist_ok=True)
 
+        # Loaded once and kept; reloaded only when the files in persist_dir change
+        self._index = None
+        self._query_engine = None
+        self._signature = None
+        self._lock = threading.Lock()
+
     def build_index_from_db(self, df):
         """Create index from DB dataframe"""
         docs = [f"HSCode: {row['hscode']}, Goods: {row['goods_description']}, Duty: {row['duty_fee']}"
@@ -17,11 +29,47 @@ class LlamaIndexTool:
         documents = SimpleDirectoryReader("data/temp").load_data()
         index = VectorStoreIndex.from_documents(documents)
         index.storage_context.persist(persist_dir=self.persist_dir)
+        with self._lock:
+            self._set_index(index, self._disk_signature())
         print("✅ Index built and persisted")
 
+    def _disk_signature(self):
+        """(name, mtime, size) of every persisted file; changes when the index is rewritten"""
+        with os.scandir(self.persist_dir) as entries:
+            return tuple(sorted(
+                (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                for entry in entries if entry.is_file()
+            ))
+
+    def _set_index(self, index, signature):
+        self._index = index
+        self._query_engine = index.as_query_engine()
+        self._signature = signature
+
+    def _engine(self):
+        """Resident query engine, (re)loaded from persist_dir only when it changed on disk"""
+        signature = self._disk_signature()
+        if self._query_engine is not None and signature == self._signature:
+            return self._query_engine
+
+        with self._lock:
+            if self._query_engine is None or signature != self._signature:
+                storage_context = StorageContext.from_defaults(persist_dir=self.persist_dir)
+                self._set_index(load_index_from_storage(storage_context), signature)
+                print("✅ Index loaded from disk")
+            return self._query_engine
+
     def query_index(self, query: str):
         """Query the persisted index"""
-        storage_context = StorageContext.from_defaults(persist_dir=self.persist_dir)
-        index = load_index_from_storage(storage_context)
-        query_engine = index.as_query_engine()
-        return query_engine.query(query)
+        return self._engine().query(query)
+
+    def query_many(self, queries, max_workers: int = LLAMA_QUERY_WORKERS):
+        """Query the index for several questions at once; results keep the input order"""
+        queries = list(queries)
+        if not queries:
+            return []
+        engine = self._engine()
+        if len(queries) == 1 or max_workers <= 1:
+            return [engine.query(q) for q in queries]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as pool:
+            return list(pool.map(engine.query, queries))
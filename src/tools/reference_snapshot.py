@@ -0,0 +1,442 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from src.utils.hs_code import normalize_hs_code
+
+# Snapshot store settings
+REFERENCE_SNAPSHOT_MODE = os.getenv("REFERENCE_SNAPSHOT_MODE", "off").lower()  # off / snapshot_first
+REFERENCE_SNAPSHOT_PATH = os.getenv("REFERENCE_SNAPSHOT_PATH", "data/reference_snapshot.sqlite3")
+# Entries older than this are not served (the API is asked instead)
+REFERENCE_SNAPSHOT_MAX_AGE = float(os.getenv("REFERENCE_SNAPSHOT_MAX_AGE", "86400"))
+# Rows per write transaction; the write lock is released between batches
+REFERENCE_SNAPSHOT_WRITE_BATCH = int(os.getenv("REFERENCE_SNAPSHOT_WRITE_BATCH", "1000"))
+
+# Background sync settings
+REFERENCE_SNAPSHOT_SYNC_INTERVAL = float(os.getenv("REFERENCE_SNAPSHOT_SYNC_INTERVAL", "900"))
+# Delta refresh re-fetches API entries older than this, oldest first
+REFERENCE_SNAPSHOT_REFRESH_AGE = float(os.getenv("REFERENCE_SNAPSHOT_REFRESH_AGE", "43200"))
+REFERENCE_SNAPSHOT_SYNC_BATCH = int(os.getenv("REFERENCE_SNAPSHOT_SYNC_BATCH", "500"))
+REFERENCE_SNAPSHOT_SYNC_WORKERS = int(os.getenv("REFERENCE_SNAPSHOT_SYNC_WORKERS", "4"))
+# Postgres table bulk-copied into the tariff snapshot ("" → tariff comes from the API only)
+REFERENCE_SNAPSHOT_TARIFF_TABLE = os.getenv("REFERENCE_SNAPSHOT_TARIFF_TABLE", "")
+
+SNAPSHOT_ENABLED = REFERENCE_SNAPSHOT_MODE == "snapshot_first"
+
+# Entry origins
+ORIGIN_API = "api"
+ORIGIN_TABLE = "table"
+
+# (normalized hs code, JSON payload or None to delete)
+SnapshotItem = Tuple[str, Optional[str]]
+
+
+class ReferenceSnapshot:
+    """
+    Local, read-optimized copy of the tariff / valuation reference data.
+
+    One SQLite file (WAL, with a separate writer connection, so lookups
+    never wait for a sync in progress) with a row per
+    (source, hs_code) holding the JSON payload, when it was fetched and
+    the snapshot version in which it last changed. Each source has a
+    version counter that is bumped by every write that changed something;
+    changed_since(version) returns the delta for consumers that mirror it.
+    """
+
+    def __init__(self, path: str = REFERENCE_SNAPSHOT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS reference_snapshot (
+                    source TEXT NOT NULL,
+                    hs_code TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    origin TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    version INTEGER NOT NULL,
+                    PRIMARY KEY (source, hs_code)
+                ) WITHOUT ROWID
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_snapshot_fetched "
+                "ON reference_snapshot (source, origin, fetched_at)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_snapshot_version ON reference_snapshot (source, version)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS snapshot_meta (
+                    source TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    synced_at REAL,
+                    table_signature TEXT
+                )
+                """
+            )
+            self._conn.commit()
+        self._writer = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+
+    def _count(self, source: str, counter: str) -> None:
+        counters = self._counters.setdefault(source, {"hits": 0, "misses": 0, "expired": 0})
+        counters[counter] += 1
+
+    # READS
+    def get(self, source: str, hs_code: str, max_age: float = REFERENCE_SNAPSHOT_MAX_AGE) -> Optional[str]:
+        """JSON payload for the code, or None when missing or older than max_age."""
+        key = normalize_hs_code(hs_code)
+        if not key:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, fetched_at FROM reference_snapshot WHERE source = ? AND hs_code = ?",
+                (source, key)
+            ).fetchone()
+            if row is None:
+                self._count(source, "misses")
+                return None
+            if max_age and time.time() - row[1] > max_age:
+                self._count(source, "expired")
+                return None
+            self._count(source, "hits")
+            return row[0]
+
+    def version(self, source: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM snapshot_meta WHERE source = ?", (source,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def changed_since(self, source: str, version: int) -> List[Dict[str, Any]]:
+        """Rows written after the given snapshot version (delta for mirrors)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT hs_code, data, version FROM reference_snapshot "
+                "WHERE source = ? AND version > ? ORDER BY version",
+                (source, version)
+            ).fetchall()
+        return [{"hs_code": code, "data": data, "version": v} for code, data, v in rows]
+
+    def stale_codes(self, source: str, older_than: float, limit: int) -> List[str]:
+        """API-fetched codes due for a delta refresh, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT hs_code FROM reference_snapshot "
+                "WHERE source = ? AND origin = ? AND fetched_at < ? ORDER BY fetched_at LIMIT ?",
+                (source, ORIGIN_API, time.time() - older_than, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def table_signature(self, source: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT table_signature FROM snapshot_meta WHERE source = ?", (source,)
+            ).fetchone()
+        return row[0] if row else None
+
+    # WRITES
+    def put(self, source: str, hs_code: str, data: Optional[str], origin: str = ORIGIN_API) -> int:
+        key = normalize_hs_code(hs_code)
+        if not key:
+            return 0
+        return self.put_many(source, [(key, data)], origin=origin, mark_synced=False)
+
+    def put_many(
+        self,
+        source: str,
+        items: Iterable[SnapshotItem],
+        origin: str = ORIGIN_API,
+        mark_synced: bool = True,
+        replace_origin: bool = False,
+        table_signature: Optional[Hashable] = None
+    ) -> int:
+        """
+        Writes items in transactions of REFERENCE_SNAPSHOT_WRITE_BATCH rows
+        and returns how many rows changed. Unchanged rows only get a new
+        fetched_at; a None payload deletes the row. replace_origin also
+        deletes rows of that origin not written by this call (full table
+        sync). Each batch that changes something is its own version; the
+        sync markers are only recorded by the last one.
+        """
+        started = time.time()
+        changed = 0
+        batch: List[SnapshotItem] = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= REFERENCE_SNAPSHOT_WRITE_BATCH:
+                changed += self._write_batch(source, batch, origin, started)
+                batch = []
+        return changed + self._write_batch(
+            source, batch, origin, started,
+            last=True, mark_synced=mark_synced, replace_origin=replace_origin, table_signature=table_signature
+        )
+
+    def _write_batch(
+        self,
+        source: str,
+        batch: List[SnapshotItem],
+        origin: str,
+        now: float,
+        last: bool = False,
+        mark_synced: bool = False,
+        replace_origin: bool = False,
+        table_signature: Optional[Hashable] = None
+    ) -> int:
+        with self._write_lock:
+            cur = self._writer.cursor()
+            row = cur.execute("SELECT version FROM snapshot_meta WHERE source = ?", (source,)).fetchone()
+            version = (row[0] if row else 0) + 1
+            changed = 0
+            try:
+                for key, data in batch:
+                    if data is None:
+                        cur.execute(
+                            "DELETE FROM reference_snapshot WHERE source = ? AND hs_code = ?",
+                            (source, key)
+                        )
+                        changed += cur.rowcount
+                        continue
+                    cur.execute(
+                        """
+                        INSERT INTO reference_snapshot (source, hs_code, data, origin, fetched_at, version)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (source, hs_code) DO UPDATE SET
+                            fetched_at = excluded.fetched_at,
+                            origin = excluded.origin,
+                            version = CASE WHEN data IS excluded.data THEN version ELSE excluded.version END,
+                            data = excluded.data
+                        """,
+                        (source, key, data, origin, now, version)
+                    )
+                    changed += cur.execute(
+                        "SELECT version = ? FROM reference_snapshot WHERE source = ? AND hs_code = ?",
+                        (version, source, key)
+                    ).fetchone()[0]
+
+                if last and replace_origin:
+                    # Every row this call wrote has fetched_at = now; older rows of the origin are gone upstream
+                    cur.execute(
+                        "DELETE FROM reference_snapshot WHERE source = ? AND origin = ? AND fetched_at < ?",
+                        (source, origin, now)
+                    )
+                    changed += cur.rowcount
+
+                if changed or last:
+                    cur.execute(
+                        """
+                        INSERT INTO snapshot_meta (source, version, synced_at, table_signature)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (source) DO UPDATE SET
+                            version = excluded.version,
+                            synced_at = COALESCE(excluded.synced_at, synced_at),
+                            table_signature = COALESCE(excluded.table_signature, table_signature)
+                        """,
+                        (
+                            source,
+                            version if changed else version - 1,
+                            time.time() if mark_synced else None,
+                            str(table_signature) if table_signature is not None else None,
+                        )
+                    )
+                self._writer.commit()
+            except Exception:
+                self._writer.rollback()
+                raise
+        return changed
+
+    def touch(self, source: str, origin: str = ORIGIN_TABLE) -> int:
+        """
+        Marks every row of the origin as fetched now and the source as
+        synced, for an upstream copy confirmed unchanged (its rows would
+        otherwise expire after max_age). Returns how many rows were touched.
+        """
+        now = time.time()
+        with self._write_lock:
+            try:
+                touched = self._writer.execute(
+                    "UPDATE reference_snapshot SET fetched_at = ? WHERE source = ? AND origin = ?",
+                    (now, source, origin)
+                ).rowcount
+                self._writer.execute(
+                    "UPDATE snapshot_meta SET synced_at = ? WHERE source = ?", (now, source)
+                )
+                self._writer.commit()
+            except Exception:
+                self._writer.rollback()
+                raise
+        return touched
+
+    def clear(self, source: Optional[str] = None) -> None:
+        with self._write_lock:
+            if source:
+                self._writer.execute("DELETE FROM reference_snapshot WHERE source = ?", (source,))
+                self._writer.execute("DELETE FROM snapshot_meta WHERE source = ?", (source,))
+            else:
+                self._writer.execute("DELETE FROM reference_snapshot")
+                self._writer.execute("DELETE FROM snapshot_meta")
+            self._writer.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, COUNT(*), MIN(fetched_at) FROM reference_snapshot GROUP BY source"
+            ).fetchall()
+            meta = {
+                row[0]: row[1:]
+                for row in self._conn.execute("SELECT source, version, synced_at FROM snapshot_meta")
+            }
+            counters = {source: dict(c) for source, c in self._counters.items()}
+
+        sources = {}
+        for source, count, oldest in rows:
+            version, synced_at = meta.get(source, (0, None))
+            sources[source] = {
+                "rows": count,
+                "version": version,
+                "synced_at": synced_at,
+                "staleness": round(now - synced_at, 1) if synced_at else None,
+                "oldest_entry_age": round(now - oldest, 1) if oldest else None,
+                **counters.get(source, {}),
+            }
+        return {"path": self.path, "mode": REFERENCE_SNAPSHOT_MODE, "sources": sources}
+
+
+class SnapshotSyncer:
+    """
+    Keeps a ReferenceSnapshot current in the background.
+
+    Every REFERENCE_SNAPSHOT_SYNC_INTERVAL seconds, per source:
+    - table sources (load_table, e.g. the tariff_data table) are bulk-copied
+      in batches of REFERENCE_SNAPSHOT_WRITE_BATCH rows, but only when the
+      table signature changed (recorded once the last batch is written);
+      an unchanged table only gets its rows' fetched_at renewed
+    - API sources get a delta refresh: up to REFERENCE_SNAPSHOT_SYNC_BATCH
+      entries older than REFERENCE_SNAPSHOT_REFRESH_AGE are re-fetched
+      (REFERENCE_SNAPSHOT_SYNC_WORKERS at a time) and only changed rows
+      bump the version
+    """
+
+    def __init__(self, snapshot: ReferenceSnapshot):
+        self.snapshot = snapshot
+        self._fetchers: Dict[str, Callable[[str], Optional[str]]] = {}
+        self._tables: Dict[str, Tuple[Callable[[], Iterable[SnapshotItem]], Callable[[], Hashable]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._round_lock = threading.Lock()
+
+    def add_api_source(self, source: str, fetch: Callable[[str], Optional[str]]) -> None:
+        """fetch(hs_code) → JSON payload, or None when the API has no data."""
+        self._fetchers[source] = fetch
+
+    def add_table_source(
+        self,
+        source: str,
+        load_items: Callable[[], Iterable[SnapshotItem]],
+        load_signature: Callable[[], Hashable]
+    ) -> None:
+        self._tables[source] = (load_items, load_signature)
+
+    def sync_table(self, source: str, force: bool = False) -> int:
+        load_items, load_signature = self._tables[source]
+        signature = load_signature()
+        if not force and signature is not None and str(signature) == self.snapshot.table_signature(source):
+            # Unchanged table: its rows are still current, so keep them from expiring
+            self.snapshot.touch(source, ORIGIN_TABLE)
+            return 0
+        return self.snapshot.put_many(
+            source, load_items(), origin=ORIGIN_TABLE, replace_origin=True, table_signature=signature
+        )
+
+    def refresh(self, source: str, codes: Optional[List[str]] = None) -> int:
+        """Re-fetches the given codes (default: the stale ones) and stores the delta."""
+        fetch = self._fetchers[source]
+        if codes is None:
+            codes = self.snapshot.stale_codes(
+                source, REFERENCE_SNAPSHOT_REFRESH_AGE, REFERENCE_SNAPSHOT_SYNC_BATCH
+            )
+        if not codes:
+            return 0
+
+        def fetch_one(code: str):
+            try:
+                return code, fetch(code), None
+            except Exception as e:
+                return code, None, e
+
+        items = []
+        with ThreadPoolExecutor(
+            max_workers=REFERENCE_SNAPSHOT_SYNC_WORKERS, thread_name_prefix=f"snapshot-{source}"
+        ) as pool:
+            for code, data, error in pool.map(fetch_one, codes):
+                if error is not None:
+                    continue  # keep the old entry; retried next round
+                items.append((code, data))
+        return self.snapshot.put_many(source, items)
+
+    def run_once(self) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        with self._round_lock:
+            for source in self._tables:
+                try:
+                    results[source] = self.sync_table(source)
+                except Exception as e:
+                    results[source] = f"failed: {e}"
+            for source in self._fetchers:
+                try:
+                    results[f"{source}_delta"] = self.refresh(source)
+                except Exception as e:
+                    results[f"{source}_delta"] = f"failed: {e}"
+        return results
+
+    def _loop(self) -> None:
+        while True:
+            results = self.run_once()
+            if any(v for v in results.values()):
+                print(f"[SNAPSHOT] Sync round: {results}")
+            if self._stop.wait(REFERENCE_SNAPSHOT_SYNC_INTERVAL):
+                return
+
+    def start(self) -> None:
+        if self._thread is not None or REFERENCE_SNAPSHOT_SYNC_INTERVAL <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="reference-snapshot-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+
+_reference_snapshot: Optional[ReferenceSnapshot] = None
+_reference_snapshot_lock = threading.Lock()
+
+
+def get_reference_snapshot() -> ReferenceSnapshot:
+    global _reference_snapshot
+    if _reference_snapshot is None:
+        with _reference_snapshot_lock:
+            if _reference_snapshot is None:
+                _reference_snapshot = ReferenceSnapshot()
+    return _reference_snapshot
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Breaker defaults (per dependency: CIRCUIT_<NAME>_FAILURES / CIRCUIT_<NAME>_RESET)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+CIRCUIT_HALF_OPEN_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_CALLS", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed → open after failure_threshold consecutive failures. While open,
+    calls fail immediately with CircuitOpenError. After reset_timeout the
+    breaker goes half-open and lets half_open_calls trial calls through:
+    a success closes it, a failure opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+        half_open_calls: int = CIRCUIT_HALF_OPEN_CALLS
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = max(1, half_open_calls)
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self._counters = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trials = 0
+        return self._state
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected (open, or half-open with no trial slot)."""
+        with self._lock:
+            state = self._current_state()
+            return state == OPEN or (state == HALF_OPEN and self._trials >= self.half_open_calls)
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError when the call must not go through."""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._trials >= self.half_open_calls):
+                self._counters["rejected"] += 1
+                raise CircuitOpenError(f"{self.name} circuit is {state}")
+            if state == HALF_OPEN:
+                self._trials += 1
+            self._counters["calls"] += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                print(f"[CIRCUIT] {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._counters["failures"] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._counters["opened"] += 1
+                    print(f"[CIRCUIT] {self.name} opened after {self._failures} failures")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def guard(self, is_failure: Callable[[Exception], bool] = lambda e: True) -> "_BreakerCall":
+        """
+        Wraps one call to the dependency (`with` or `async with`).
+        Exceptions for which is_failure() is true count against the breaker;
+        any other exception (or cancellation) is neutral: it neither closes
+        the breaker nor resets the failure count. All exceptions propagate.
+        """
+        return _BreakerCall(self, is_failure)
+
+    def _finish_call(self, exc: Optional[BaseException], is_failure: Callable[[Exception], bool]) -> None:
+        if exc is None:
+            self.record_success()
+        elif isinstance(exc, Exception) and is_failure(exc):
+            self.record_failure()
+        else:
+            # Says nothing about the dependency (e.g. our own scheduler shed the
+            # call before it was sent, or it was cancelled): free the trial slot
+            with self._lock:
+                if self._state == HALF_OPEN:
+                    self._trials = max(0, self._trials - 1)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trials = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "retry_in": round(max(0.0, self._opened_at + self.reset_timeout - time.monotonic()), 1)
+                if state == OPEN else None,
+                **self._counters,
+            }
+
+
+class _BreakerCall:
+    """Context manager returned by CircuitBreaker.guard()."""
+
+    def __init__(self, breaker: CircuitBreaker, is_failure: Callable[[Exception], bool]):
+        self.breaker = breaker
+        self.is_failure = is_failure
+
+    def __enter__(self) -> "_BreakerCall":
+        self.breaker.before_call()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.breaker._finish_call(exc, self.is_failure)
+        return False
+
+    async def __aenter__(self) -> "_BreakerCall":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return self.__exit__(exc_type, exc, tb)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for a dependency, created on first use."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            env = name.upper()
+            breaker = CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv(f"CIRCUIT_{env}_FAILURES", CIRCUIT_FAILURE_THRESHOLD)),
+                reset_timeout=float(os.getenv(f"CIRCUIT_{env}_RESET", CIRCUIT_RESET_TIMEOUT))
+            )
+            _breakers[name] = breaker
+        return breaker
+
+
+def circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+def reset_circuit_breaker(name: Optional[str] = None) -> None:
+    """Force-closes one breaker (or all of them)."""
+    with _breakers_lock:
+        breakers = [_breakers[name]] if name in _breakers else ([] if name else list(_breakers.values()))
+    for breaker in breakers:
+        breaker.reset()
@@ -1,17 +1,499 @@
-from config import OLLAMA_URL, MODEL_NAME
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Optional, Sequence, Type, TypeVar
+import httpx
 import requests
+from pydantic import BaseModel, ValidationError
+from config import MODEL_NAME
+from src.utils.http_client import (
+    get_session,
+    get_async_client,
+    timeout_for,
+    async_timeout_for
+)
+from src.utils.llm_backends import llm_backend_pool, LLMBackend
+from src.utils.llm_cache import get_llm_cache, llm_cache_key
+from src.utils.llm_scheduler import llm_slot, allm_slot, LLMOverloadedError
+from src.utils.circuit_breaker import get_circuit_breaker
 
-def llm(prompt: str) -> str:
-    response = requests.post(
-        OLLAMA_URL,
-        json={
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": False
-        },
-        timeout=120
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+# Streaming + generation defaults (per-call arguments override these)
+LLM_STREAM = os.getenv("LLM_STREAM", "true").lower() == "true"
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE")  # e.g. "10m"
+LLM_DEFAULT_OPTIONS: Dict[str, Any] = {
+    key: cast(os.environ[env])
+    for key, env, cast in (
+        ("num_predict", "LLM_NUM_PREDICT", int),
+        ("temperature", "LLM_TEMPERATURE", float),
     )
-    response.raise_for_status()
-    return response.json().get("response", "")
+    if os.getenv(env)
+}
+
+# Structured (JSON schema) output for agent prompts. Off by default: the
+# free-text path streams and stops generation as soon as the expected fields
+# are complete, which a JSON reply (only valid once the object closes) cannot
+# do. Turn it on to trade that early stop for schema-validated replies and
+# fewer re-prompts on unparsable output.
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "false").lower() == "true"
+LLM_STRUCTURED_RETRIES = int(os.getenv("LLM_STRUCTURED_RETRIES", "2"))
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+class LLMSchemaError(ValueError):
+    """The LLM reply did not validate against the requested schema."""
+
+
+def compact_prompt(prompt: str) -> str:
+    """Strips per-line indentation and repeated blank lines from a prompt."""
+    lines = []
+    for line in prompt.strip().splitlines():
+        line = line.strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def json_response_format(model_cls: Type[BaseModel]) -> str:
+    """Response-format instruction used with structured output."""
+    return f"Respond ONLY with a JSON object with the fields: {', '.join(model_cls.model_fields)}"
+
+
+def _options(options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Generation options sent to Ollama (defaults overridden per call)."""
+    return {**LLM_DEFAULT_OPTIONS, **(options or {})}
+
+
+def _cached_response(cache, key_for: Callable[[str], str]) -> Optional[str]:
+    # Any model the pool could route this call to may have answered it before
+    for model in llm_backend_pool.models():
+        cached = cache.get(key_for(model))
+        if cached is not None:
+            return cached
+    return None
+
+
+def _cache_lookup(prompt: str, use_cache: bool, options: Optional[Dict[str, Any]]):
+    """Returns (cache, cached_response); cache is None when bypassed."""
+    cache = get_llm_cache() if use_cache else None
+    if cache is None:
+        return None, None
+    return cache, _cached_response(cache, lambda model: llm_cache_key(prompt, model, _options(options)))
+
+
+async def _acache_lookup(prompt: str, use_cache: bool, options: Optional[Dict[str, Any]]):
+    """_cache_lookup() off the event loop (the SQLite backend blocks)."""
+    return await asyncio.to_thread(_cache_lookup, prompt, use_cache, options)
+
+
+def _payload(
+    prompt: str,
+    stream: bool,
+    options: Optional[Dict[str, Any]],
+    keep_alive: Optional[str]
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "model": MODEL_NAME,
+        "prompt": compact_prompt(prompt),
+        "stream": stream
+    }
+    merged = _options(options)
+    if merged:
+        payload["options"] = merged
+    if keep_alive or LLM_KEEP_ALIVE:
+        payload["keep_alive"] = keep_alive or LLM_KEEP_ALIVE
+    return payload
+
+
+def _stream_complete(
+    text: str,
+    stop_fields: Sequence[str],
+    max_words: Optional[int]
+) -> bool:
+    """
+    True once every expected field label has appeared and the last field's
+    value is finished (its line ended) or has reached the word budget.
+    """
+    if not stop_fields:
+        return bool(max_words) and len(text.split()) >= max_words
+
+    position = 0
+    for field in stop_fields:
+        position = text.find(field, position)
+        if position == -1:
+            return False
+        position += len(field)
+
+    value = text[position:].lstrip()
+    if value and "\n" in value:
+        return True
+    return bool(max_words) and len(value.split()) >= max_words
+
+
+def _trim_to_budget(text: str, stop_fields: Sequence[str], max_words: Optional[int]) -> str:
+    """After an early stop: drop anything past the last field's line / word budget."""
+    if not stop_fields:
+        return " ".join(text.split()[:max_words]) if max_words else text
+
+    head, label, value = text.rpartition(stop_fields[-1])
+    if not label:
+        return text
+    value = value.strip().split("\n", 1)[0]
+    if max_words:
+        value = " ".join(value.split()[:max_words])
+    return f"{head}{label} {value}"
+
+
+def _stream_chunk(line) -> Dict[str, Any]:
+    if not line:
+        return {}
+    return json.loads(line)
+
+
+# CIRCUIT BREAKER
+_ollama_breaker = get_circuit_breaker("ollama")
+
+
+def _llm_guard():
+    """
+    Breaker around one Ollama request, checked before a scheduler slot is
+    taken so an open circuit fails fast (CircuitOpenError). Our own
+    scheduler rejections do not count as Ollama failures.
+    """
+    return _ollama_breaker.guard(lambda e: not isinstance(e, LLMOverloadedError))
+
+
+# BACKEND POOL
+# Connection-level failures: the request never reached Ollama, so it is
+# safe to retry it on another backend
+_CONNECT_ERRORS = (requests.ConnectionError,)
+_ACONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def _for_backend(payload: Dict[str, Any], backend: LLMBackend) -> Dict[str, Any]:
+    return {**payload, "model": backend.model}
+
+
+class _Dispatch:
+    """Records which backend answered, so the reply is cached under its model."""
+
+    __slots__ = ("answered_by",)
+
+    def __init__(self):
+        self.answered_by: Optional[LLMBackend] = None
+
+    @property
+    def model(self) -> str:
+        return self.answered_by.model if self.answered_by else MODEL_NAME
+
+
+@contextmanager
+def _backend_post(
+    payload: Dict[str, Any],
+    stream: bool = False,
+    dispatch: Optional[_Dispatch] = None
+):
+    """
+    POSTs the payload to the least-loaded backend and yields the response.
+    Entered inside the scheduler slot, so the backend is picked right before
+    the request (queued calls never count as outstanding). A backend that
+    cannot be reached is marked failed and the next one is tried;
+    dispatch.answered_by records who answered.
+    """
+    tried = []
+    while True:
+        backend = llm_backend_pool.acquire(exclude=tried)
+        if backend is None:
+            raise last_error
+        tried.append(backend)
+        try:
+            response = get_session().post(
+                backend.url,
+                json=_for_backend(payload, backend),
+                timeout=timeout_for(LLM_TIMEOUT),
+                stream=stream
+            )
+        except _CONNECT_ERRORS as e:
+            llm_backend_pool.release(backend)
+            llm_backend_pool.mark_failure(backend)
+            last_error = e
+            continue
+        if dispatch is not None:
+            dispatch.answered_by = backend
+
+        try:
+            with response:
+                yield response
+            llm_backend_pool.mark_success(backend)
+        finally:
+            llm_backend_pool.release(backend)
+        return
+
+
+@asynccontextmanager
+async def _abackend_post(
+    payload: Dict[str, Any],
+    stream: bool = False,
+    dispatch: Optional[_Dispatch] = None
+):
+    """Async variant of _backend_post()."""
+    client = get_async_client()
+    tried = []
+    while True:
+        backend = llm_backend_pool.acquire(exclude=tried)
+        if backend is None:
+            raise last_error
+        tried.append(backend)
+        request = client.build_request(
+            "POST",
+            backend.url,
+            json=_for_backend(payload, backend),
+            timeout=async_timeout_for(LLM_TIMEOUT)
+        )
+        try:
+            response = await client.send(request, stream=stream)
+        except _ACONNECT_ERRORS as e:
+            llm_backend_pool.release(backend)
+            llm_backend_pool.mark_failure(backend)
+            last_error = e
+            continue
+        if dispatch is not None:
+            dispatch.answered_by = backend
+
+        try:
+            yield response
+            llm_backend_pool.mark_success(backend)
+        finally:
+            await response.aclose()
+            llm_backend_pool.release(backend)
+        return
+
+
+def _generate(payload: Dict[str, Any], dispatch: Optional[_Dispatch] = None) -> str:
+    with _backend_post(payload, dispatch=dispatch) as response:
+        response.raise_for_status()
+        return response.json().get("response", "")
+
+
+async def _agenerate(payload: Dict[str, Any], dispatch: Optional[_Dispatch] = None) -> str:
+    async with _abackend_post(payload, dispatch=dispatch) as response:
+        response.raise_for_status()
+        return response.json().get("response", "")
+
+
+def llm(
+    prompt: str,
+    use_cache: bool = True,
+    stream: Optional[bool] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    stop_fields: Sequence[str] = (),
+    max_words: Optional[int] = None,
+    options: Optional[Dict[str, Any]] = None,
+    keep_alive: Optional[str] = None
+) -> str:
+    """
+    Calls Ollama. Identical prompts (modulo whitespace) for the same model
+    and options are served from the LLM response cache unless use_cache=False.
+
+    Streaming mode (default LLM_STREAM) reads tokens as they arrive, passes
+    each to on_token, and stops generation early once stop_fields (e.g.
+    ("Status:", "Explanation:")) are complete or max_words is reached.
+    options / keep_alive are passed through to Ollama.
+
+    Calls that reach Ollama go through the LLM scheduler (priority queue +
+    adaptive in-flight limit) and may raise LLMOverloadedError.
+    """
+    cache, cached = _cache_lookup(prompt, use_cache, options)
+    if cached is not None:
+        return cached
+
+    stream = LLM_STREAM if stream is None else stream
+    payload = _payload(prompt, stream, options, keep_alive)
+    dispatch = _Dispatch()
+
+    if not stream:
+        with _llm_guard(), llm_slot():
+            text = _generate(payload, dispatch)
+    else:
+        parts = []
+        stopped_early = False
+        # Closing the response early makes Ollama abort the generation
+        with _llm_guard(), llm_slot(), _backend_post(payload, stream=True, dispatch=dispatch) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                chunk = _stream_chunk(line)
+                token = chunk.get("response", "")
+                if token:
+                    parts.append(token)
+                    if on_token:
+                        on_token(token)
+                if chunk.get("done"):
+                    break
+                if token and _stream_complete("".join(parts), stop_fields, max_words):
+                    stopped_early = True
+                    break
+        text = "".join(parts)
+        if stopped_early:
+            text = _trim_to_budget(text, stop_fields, max_words)
+
+    if cache is not None and text:
+        cache.set(llm_cache_key(prompt, dispatch.model, _options(options)), text)
+    return text
+
+
+async def allm(
+    prompt: str,
+    use_cache: bool = True,
+    stream: Optional[bool] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    stop_fields: Sequence[str] = (),
+    max_words: Optional[int] = None,
+    options: Optional[Dict[str, Any]] = None,
+    keep_alive: Optional[str] = None
+) -> str:
+    """Async variant of llm() for the async request path."""
+    cache, cached = await _acache_lookup(prompt, use_cache, options)
+    if cached is not None:
+        return cached
+
+    stream = LLM_STREAM if stream is None else stream
+    payload = _payload(prompt, stream, options, keep_alive)
+    dispatch = _Dispatch()
+
+    if not stream:
+        async with _llm_guard(), allm_slot():
+            text = await _agenerate(payload, dispatch)
+    else:
+        parts = []
+        stopped_early = False
+        async with _llm_guard(), allm_slot(), \
+                _abackend_post(payload, stream=True, dispatch=dispatch) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                chunk = _stream_chunk(line)
+                token = chunk.get("response", "")
+                if token:
+                    parts.append(token)
+                    if on_token:
+                        on_token(token)
+                if chunk.get("done"):
+                    break
+                if token and _stream_complete("".join(parts), stop_fields, max_words):
+                    stopped_early = True
+                    break
+        text = "".join(parts)
+        if stopped_early:
+            text = _trim_to_budget(text, stop_fields, max_words)
+
+    if cache is not None and text:
+        key = llm_cache_key(prompt, dispatch.model, _options(options))
+        await asyncio.to_thread(cache.set, key, text)
+    return text
+
+
+# STRUCTURED OUTPUT
+def _structured_payload(
+    prompt: str,
+    model_cls: Type[BaseModel],
+    options: Optional[Dict[str, Any]],
+    keep_alive: Optional[str]
+) -> Dict[str, Any]:
+    payload = _payload(prompt, False, options, keep_alive)
+    payload["format"] = model_cls.model_json_schema()
+    return payload
+
+
+def _structured_cache_key(
+    prompt: str,
+    model_cls: Type[BaseModel],
+    model: str,
+    options: Optional[Dict[str, Any]]
+) -> str:
+    return llm_cache_key(prompt, f"{model}:{model_cls.__name__}", _options(options))
+
+
+def _structured_cache_lookup(
+    prompt: str,
+    model_cls: Type[ModelT],
+    use_cache: bool,
+    options: Optional[Dict[str, Any]]
+):
+    cache = get_llm_cache() if use_cache else None
+    if cache is None:
+        return None, None
+    cached = _cached_response(cache, lambda model: _structured_cache_key(prompt, model_cls, model, options))
+    return cache, model_cls.model_validate_json(cached) if cached else None
+
+
+def llm_structured(
+    prompt: str,
+    model_cls: Type[ModelT],
+    retries: Optional[int] = None,
+    use_cache: bool = True,
+    options: Optional[Dict[str, Any]] = None,
+    keep_alive: Optional[str] = None
+) -> ModelT:
+    """
+    Calls Ollama with `format` set to model_cls's JSON schema and validates
+    the reply into model_cls. Schema violations are retried up to `retries`
+    times (default LLM_STRUCTURED_RETRIES), then LLMSchemaError is raised.
+    """
+    cache, cached = _structured_cache_lookup(prompt, model_cls, use_cache, options)
+    if cached is not None:
+        return cached
+
+    payload = _structured_payload(prompt, model_cls, options, keep_alive)
+    attempts = 1 + (LLM_STRUCTURED_RETRIES if retries is None else retries)
+
+    last_error: Optional[ValidationError] = None
+    for _ in range(attempts):
+        dispatch = _Dispatch()
+        with _llm_guard(), llm_slot():
+            text = _generate(payload, dispatch)
+        try:
+            output = model_cls.model_validate_json(text)
+        except ValidationError as e:
+            last_error = e
+            continue
+        if cache is not None:
+            cache.set(_structured_cache_key(prompt, model_cls, dispatch.model, options), output.model_dump_json())
+        return output
+
+    raise LLMSchemaError(f"{model_cls.__name__} schema violation after {attempts} attempts: {last_error}")
+
+
+async def allm_structured(
+    prompt: str,
+    model_cls: Type[ModelT],
+    retries: Optional[int] = None,
+    use_cache: bool = True,
+    options: Optional[Dict[str, Any]] = None,
+    keep_alive: Optional[str] = None
+) -> ModelT:
+    """Async variant of llm_structured()."""
+    cache, cached = await asyncio.to_thread(_structured_cache_lookup, prompt, model_cls, use_cache, options)
+    if cached is not None:
+        return cached
+
+    payload = _structured_payload(prompt, model_cls, options, keep_alive)
+    attempts = 1 + (LLM_STRUCTURED_RETRIES if retries is None else retries)
 
+    last_error: Optional[ValidationError] = None
+    for _ in range(attempts):
+        dispatch = _Dispatch()
+        async with _llm_guard(), allm_slot():
+            text = await _agenerate(payload, dispatch)
+        try:
+            output = model_cls.model_validate_json(text)
+        except ValidationError as e:
+            last_error = e
+            continue
+        if cache is not None:
+            key = _structured_cache_key(prompt, model_cls, dispatch.model, options)
+            await asyncio.to_thread(cache.set, key, output.model_dump_json())
+        return output
 
+    raise LLMSchemaError(f"{model_cls.__name__} schema violation after {attempts} attempts: {last_error}")
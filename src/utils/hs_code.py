@@ -0,0 +1,14 @@
+import re
+from typing import Optional
+
+_NON_DIGITS = re.compile(r"[^0-9]")
+
+
+def normalize_hs_code(hs_code: Optional[str]) -> str:
+    """
+    Normalizes an HS code for comparison / lookup keys:
+    "0101.21 00" -> "01012100"
+    """
+    if hs_code is None:
+        return ""
+    return _NON_DIGITS.sub("", str(hs_code))
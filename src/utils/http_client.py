@@ -0,0 +1,90 @@
+import asyncio
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Pool sizing / timeouts for all outbound HTTP calls
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # hosts kept pooled
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "50"))  # connections per host
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# httpx clients are bound to the event loop they were first used on
+_async_clients: Dict[int, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+
+
+def timeout_for(read: Optional[float] = None) -> Tuple[float, float]:
+    """(connect, read) timeout tuple for requests."""
+    return (HTTP_CONNECT_TIMEOUT, read if read is not None else HTTP_READ_TIMEOUT)
+
+
+def async_timeout_for(read: Optional[float] = None) -> httpx.Timeout:
+    """Same timeouts as timeout_for(), for httpx."""
+    return httpx.Timeout(
+        read if read is not None else HTTP_READ_TIMEOUT,
+        connect=HTTP_CONNECT_TIMEOUT
+    )
+
+
+def get_session() -> requests.Session:
+    """Process-wide keep-alive Session with per-host connection pools."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=HTTP_POOL_MAXSIZE
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Keep-alive AsyncClient shared by everything running on the current loop."""
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(id(loop))
+    if entry is not None and entry[0] is loop:
+        return entry[1]
+
+    # Forget clients whose loop has gone away
+    for key, (other_loop, _) in list(_async_clients.items()):
+        if other_loop.is_closed():
+            del _async_clients[key]
+
+    client = httpx.AsyncClient(
+        timeout=async_timeout_for(),
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+            max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    _async_clients[id(loop)] = (loop, client)
+    return client
+
+
+def close_session() -> None:
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+async def aclose_async_client() -> None:
+    """Closes the AsyncClient bound to the current loop (call on shutdown)."""
+    entry = _async_clients.pop(id(asyncio.get_running_loop()), None)
+    if entry is not None:
+        await entry[1].aclose()
@@ -0,0 +1,188 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import requests
+
+from config import OLLAMA_URL, MODEL_NAME
+from src.utils.http_client import get_session, timeout_for
+
+# LLM_BACKENDS: JSON list of {"url": ..., "weight": 1, "model": null}.
+# Unset → a single backend at config.OLLAMA_URL.
+LLM_BACKENDS = os.getenv("LLM_BACKENDS")
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "15"))
+LLM_HEALTH_TIMEOUT = float(os.getenv("LLM_HEALTH_TIMEOUT", "3"))
+LLM_BACKEND_MAX_FAILURES = int(os.getenv("LLM_BACKEND_MAX_FAILURES", "1"))
+
+
+class LLMBackend:
+    """One Ollama endpoint plus its routing / health bookkeeping."""
+
+    def __init__(
+        self,
+        url: str,
+        weight: float = 1.0,
+        model: Optional[str] = None,
+        health_url: Optional[str] = None
+    ):
+        self.url = url
+        self.weight = max(float(weight), 0.01)
+        self.model = model or MODEL_NAME
+        self.health_url = health_url or _health_url(url)
+
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.ejected_at: Optional[float] = None
+        self.requests = 0
+        self.errors = 0
+
+    def load(self) -> float:
+        return self.outstanding / self.weight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "model": self.model,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejected_for": round(time.time() - self.ejected_at, 1) if self.ejected_at else None,
+        }
+
+
+def _health_url(url: str) -> str:
+    # .../api/generate → .../api/tags (cheap, does not load a model)
+    base, _, _ = url.rpartition("/api/")
+    return f"{base}/api/tags" if base else url
+
+
+def _load_backends(raw: Optional[str]) -> List[LLMBackend]:
+    if not raw:
+        return [LLMBackend(OLLAMA_URL)]
+    return [
+        LLMBackend(
+            url=entry["url"],
+            weight=entry.get("weight", 1),
+            model=entry.get("model"),
+            health_url=entry.get("health_url"),
+        )
+        for entry in json.loads(raw)
+    ]
+
+
+class LLMBackendPool:
+    """
+    Routes LLM requests over several Ollama endpoints.
+
+    acquire() picks the healthy backend with the fewest outstanding requests
+    relative to its weight (random tie-break). A backend that fails to
+    connect LLM_BACKEND_MAX_FAILURES times in a row is ejected; the health
+    checker re-admits it once its health URL answers again. If every backend
+    is ejected, requests still go to the least-loaded one instead of failing.
+    """
+
+    def __init__(self, backends: Iterable[LLMBackend]):
+        self.backends = list(backends)
+        if not self.backends:
+            raise ValueError("LLM backend pool needs at least one backend")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checker: Optional[threading.Thread] = None
+
+    def acquire(self, exclude: Iterable[LLMBackend] = ()) -> Optional[LLMBackend]:
+        """Reserves the best backend not in exclude (None when all were tried)."""
+        exclude = list(exclude)
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+            healthy = [b for b in candidates if b.healthy] or candidates
+            lowest = min(b.load() for b in healthy)
+            backend = random.choice([b for b in healthy if b.load() == lowest])
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def models(self) -> List[str]:
+        """Distinct models the pool would route to right now (healthy backends first)."""
+        with self._lock:
+            healthy = [b for b in self.backends if b.healthy] or self.backends
+            return list(dict.fromkeys(b.model for b in healthy))
+
+    def release(self, backend: LLMBackend) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+
+    def mark_success(self, backend: LLMBackend) -> None:
+        with self._lock:
+            backend.failures = 0
+
+    def mark_failure(self, backend: LLMBackend) -> None:
+        """Connection-level failure; ejects the backend after repeated failures."""
+        with self._lock:
+            backend.errors += 1
+            backend.failures += 1
+            if backend.healthy and backend.failures >= LLM_BACKEND_MAX_FAILURES:
+                backend.healthy = False
+                backend.ejected_at = time.time()
+                print(f"[LLM POOL] Ejected {backend.url}")
+
+    def _readmit(self, backend: LLMBackend) -> None:
+        with self._lock:
+            if not backend.healthy:
+                print(f"[LLM POOL] Re-admitted {backend.url}")
+            backend.healthy = True
+            backend.failures = 0
+            backend.ejected_at = None
+
+    # HEALTH CHECKS
+    def check_health(self) -> None:
+        """Probes every backend once: ejects dead ones, re-admits recovered ones."""
+        for backend in self.backends:
+            try:
+                response = get_session().get(
+                    backend.health_url, timeout=timeout_for(LLM_HEALTH_TIMEOUT)
+                )
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+
+            if ok:
+                self._readmit(backend)
+            elif backend.healthy:
+                with self._lock:
+                    backend.healthy = False
+                    backend.ejected_at = time.time()
+                print(f"[LLM POOL] Health check failed, ejected {backend.url}")
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(LLM_HEALTH_INTERVAL):
+            self.check_health()
+
+    def start_health_checks(self) -> None:
+        if self._checker is not None or LLM_HEALTH_INTERVAL <= 0:
+            return
+        self._stop.clear()
+        self._checker = threading.Thread(
+            target=self._health_loop, name="llm-health-check", daemon=True
+        )
+        self._checker.start()
+
+    def stop_health_checks(self) -> None:
+        self._stop.set()
+        if self._checker is not None:
+            self._checker.join(timeout=LLM_HEALTH_TIMEOUT + 1)
+            self._checker = None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+
+
+llm_backend_pool = LLMBackendPool(_load_backends(LLM_BACKENDS))
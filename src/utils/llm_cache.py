@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from src.utils.ttl_cache import TTLCache
+
+# LLM response cache settings
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory").lower()  # memory / sqlite / off
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "4096"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+# Seconds between sweeps of expired rows (SQLite backend)
+LLM_CACHE_PRUNE_INTERVAL = float(os.getenv("LLM_CACHE_PRUNE_INTERVAL", "300"))
+
+
+def llm_cache_key(prompt: str, model: str, options: Optional[Mapping[str, Any]] = None) -> str:
+    """sha256 over model name + generation options + prompt with whitespace runs collapsed."""
+    normalized = " ".join(prompt.split())
+    settings = json.dumps(dict(options or {}), sort_keys=True, default=str)
+    return hashlib.sha256(f"{model}\x00{settings}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+class MemoryLLMCache:
+    """In-process LRU + TTL backend."""
+
+    def __init__(self, maxsize: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL):
+        self._cache = TTLCache("llm", maxsize=maxsize, ttl=ttl, negative_ttl=0)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def set(self, key: str, response: str) -> None:
+        self._cache.set(key, response)
+
+    def clear(self) -> None:
+        self._cache.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class SQLiteLLMCache:
+    """On-disk backend; survives restarts and is shared by worker processes."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._pruned_at = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache (expires_at)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return row[0]
+
+    def set(self, key: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                (key, response, now + self.ttl)
+            )
+            # Expired rows are never served (get() filters them); sweep them now and then
+            if now - self._pruned_at >= LLM_CACHE_PRUNE_INTERVAL:
+                self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+                self._pruned_at = now
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return {
+                "backend": "sqlite",
+                "path": self.path,
+                "size": size,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Returns the configured backend, or None when LLM_CACHE_BACKEND=off."""
+    global _llm_cache
+    if LLM_CACHE_BACKEND in ("off", "none", ""):
+        return None
+
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                if LLM_CACHE_BACKEND == "sqlite":
+                    _llm_cache = SQLiteLLMCache()
+                else:
+                    _llm_cache = MemoryLLMCache()
+    return _llm_cache
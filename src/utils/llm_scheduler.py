@@ -0,0 +1,288 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional
+
+# Priorities (lower runs first)
+INTERACTIVE = 0
+BATCH = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Priority of the LLM calls made from the current task / thread
+llm_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+# Scheduler settings
+LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "true").lower() == "true"
+LLM_CONCURRENCY_INITIAL = float(os.getenv("LLM_CONCURRENCY_INITIAL", "4"))
+LLM_CONCURRENCY_MIN = float(os.getenv("LLM_CONCURRENCY_MIN", "1"))
+LLM_CONCURRENCY_MAX = float(os.getenv("LLM_CONCURRENCY_MAX", "16"))
+LLM_TARGET_LATENCY = float(os.getenv("LLM_TARGET_LATENCY", "30"))
+LLM_BACKOFF_FACTOR = float(os.getenv("LLM_BACKOFF_FACTOR", "0.7"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "60"))
+
+
+class LLMOverloadedError(RuntimeError):
+    """Raised instead of queueing when the LLM scheduler is saturated."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued", "granted", "abandoned", "event", "loop", "future")
+
+    def __init__(self, priority: int, is_async: bool):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.abandoned = False
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        if is_async:
+            self.loop = asyncio.get_running_loop()
+            self.future = self.loop.create_future()
+        else:
+            self.event = threading.Event()
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMScheduler:
+    """
+    Bounded, priority-ordered admission in front of the LLM backend.
+
+    The in-flight limit follows AIMD: every call that finishes within
+    target_latency raises it by 1/limit (about +1 per round of calls); a
+    slow or failed call multiplies it by backoff_factor. Waiting calls are
+    admitted by priority, then FIFO. When more than max_queue calls are
+    waiting, or a call waits longer than max_queue_wait, LLMOverloadedError
+    is raised so callers fall back instead of piling onto Ollama.
+
+    Works for both threads (slot) and event loops (aslot).
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = LLM_CONCURRENCY_INITIAL,
+        min_limit: float = LLM_CONCURRENCY_MIN,
+        max_limit: float = LLM_CONCURRENCY_MAX,
+        target_latency: float = LLM_TARGET_LATENCY,
+        backoff_factor: float = LLM_BACKOFF_FACTOR,
+        max_queue: int = LLM_MAX_QUEUE,
+        max_queue_wait: float = LLM_MAX_QUEUE_WAIT
+    ):
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.target_latency = target_latency
+        self.backoff_factor = backoff_factor
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+
+        self._lock = threading.Lock()
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._increases = 0
+        self._decreases = 0
+        self._last_decrease = 0.0
+        self._wait_total = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self._wait_max = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self._wait_count = {priority: 0 for priority in PRIORITY_NAMES}
+
+    # ADMISSION
+    def _try_admit(self, priority: int, is_async: bool) -> Optional[_Waiter]:
+        """Admits immediately or enqueues; returns the waiter to block on (None = admitted)."""
+        with self._lock:
+            if not self._heap and self._in_flight < int(self.limit):
+                self._in_flight += 1
+                self._admitted += 1
+                self._record_wait(priority, 0.0)
+                return None
+
+            if sum(self._queued.values()) >= self.max_queue:
+                self._rejected += 1
+                raise LLMOverloadedError(
+                    f"LLM queue full ({self.max_queue} waiting, {self._in_flight} in flight)"
+                )
+
+            waiter = _Waiter(priority, is_async)
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            self._queued[priority] += 1
+            return waiter
+
+    def _grant_next(self) -> None:
+        """Hands free slots to the best waiting calls. Caller holds the lock."""
+        while self._heap and self._in_flight < int(self.limit):
+            _, _, waiter = heapq.heappop(self._heap)
+            if waiter.abandoned:
+                continue
+            self._queued[waiter.priority] -= 1
+            waiter.granted = True
+            self._in_flight += 1
+            self._admitted += 1
+            self._record_wait(waiter.priority, time.monotonic() - waiter.enqueued)
+            waiter.wake()
+
+    def _abandon(self, waiter: _Waiter, timed_out: bool) -> bool:
+        """
+        A waiter gave up (timeout / cancellation). Returns True when the slot
+        was granted just before, in which case the caller now owns it.
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            self._queued[waiter.priority] -= 1
+            if timed_out:
+                self._timed_out += 1
+            return False
+
+    def _give_back(self) -> None:
+        """Returns an unused slot without touching the limit."""
+        with self._lock:
+            self._in_flight -= 1
+            self._grant_next()
+
+    def _release(self, started: float, failed: bool) -> None:
+        finished = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            if failed or finished - started > self.target_latency:
+                # Back off once per round: calls started before the last
+                # decrease already saw the old limit
+                if started >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+                    self._last_decrease = finished
+                    self._decreases += 1
+            elif self._in_flight + 1 >= int(self.limit):
+                # Only grow while the current limit is actually being used
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self._increases += 1
+            self._grant_next()
+
+    def _record_wait(self, priority: int, waited: float) -> None:
+        self._wait_total[priority] += waited
+        self._wait_count[priority] += 1
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+
+    def _queue_timeout(self, waiter: _Waiter) -> LLMOverloadedError:
+        return LLMOverloadedError(
+            f"Waited {self.max_queue_wait}s for an LLM slot "
+            f"({PRIORITY_NAMES.get(waiter.priority, waiter.priority)} priority)"
+        )
+
+    # SYNC
+    @contextmanager
+    def slot(self, priority: Optional[int] = None):
+        """Holds one in-flight LLM slot for the duration of the block."""
+        priority = llm_priority.get() if priority is None else priority
+        waiter = self._try_admit(priority, is_async=False)
+        if waiter is not None and not waiter.event.wait(self.max_queue_wait):
+            if not self._abandon(waiter, timed_out=True):
+                raise self._queue_timeout(waiter)
+
+        started = time.monotonic()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._release(started, failed)
+
+    # ASYNC
+    @asynccontextmanager
+    async def aslot(self, priority: Optional[int] = None):
+        """Async variant of slot()."""
+        priority = llm_priority.get() if priority is None else priority
+        waiter = self._try_admit(priority, is_async=True)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.max_queue_wait)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter, timed_out=True):
+                    raise self._queue_timeout(waiter)
+            except asyncio.CancelledError:
+                if self._abandon(waiter, timed_out=False):
+                    self._give_back()
+                raise
+
+        started = time.monotonic()
+        failed = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise  # the caller went away; not a signal about the backend
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._release(started, failed)
+
+    # METRICS
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": LLM_SCHEDULER_ENABLED,
+                "limit": round(self.limit, 2),
+                "in_flight": self._in_flight,
+                "queue_depth": {
+                    PRIORITY_NAMES[p]: count for p, count in self._queued.items()
+                },
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "queue_timeouts": self._timed_out,
+                "limit_increases": self._increases,
+                "limit_decreases": self._decreases,
+                "wait_seconds": {
+                    PRIORITY_NAMES[p]: {
+                        "avg": round(self._wait_total[p] / self._wait_count[p], 4)
+                        if self._wait_count[p] else 0.0,
+                        "max": round(self._wait_max[p], 4),
+                    }
+                    for p in PRIORITY_NAMES
+                },
+            }
+
+
+llm_scheduler = LLMScheduler()
+
+
+@contextmanager
+def llm_slot():
+    """scheduler.slot(), or a no-op when LLM_SCHEDULER_ENABLED=false."""
+    if not LLM_SCHEDULER_ENABLED:
+        yield
+        return
+    with llm_scheduler.slot():
+        yield
+
+
+@asynccontextmanager
+async def allm_slot():
+    if not LLM_SCHEDULER_ENABLED:
+        yield
+        return
+    async with llm_scheduler.aslot():
+        yield
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls for the same key: the first caller runs
+    the function, callers arriving while it is in flight wait and share its
+    result (or exception). Nothing is kept once the call completes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Tuple[int, Hashable], asyncio.Task] = {}
+        self._counters = {"calls": 0, "executions": 0, "coalesced": 0}
+
+    # SYNC
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._counters["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._counters["executions"] += 1
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    # ASYNC
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # In-flight tasks are per event loop
+        task_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            self._counters["calls"] += 1
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = asyncio.ensure_future(fn())
+                self._tasks[task_key] = task
+                self._counters["executions"] += 1
+                task.add_done_callback(lambda _: self._forget(task_key, task))
+            else:
+                self._counters["coalesced"] += 1
+
+        # shield: one caller going away must not cancel the shared lookup
+        return await asyncio.shield(task)
+
+    def _forget(self, task_key: Tuple[int, Hashable], task: asyncio.Task) -> None:
+        with self._lock:
+            if self._tasks.get(task_key) is task:
+                del self._tasks[task_key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved; waiters re-raise it themselves
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
+
+
+_flights: Dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Process-wide single-flight group, created on first use."""
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = _flights[name] = SingleFlight(name)
+        return flight
+
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    with _flights_lock:
+        flights = list(_flights.values())
+    return {flight.name: flight.stats() for flight in flights}
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with TTL expiry and LRU eviction.
+
+    - ttl:          seconds an entry is served as fresh
+    - negative_ttl: seconds a None ("no results") entry is kept (0 disables)
+    - stale_ttl:    extra seconds an expired entry is still served while it
+                    is refreshed in the background (stale-while-revalidate)
+
+    Loader exceptions are never cached; they propagate to the caller.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 1024,
+        ttl: float = 3600,
+        negative_ttl: float = 300,
+        stale_ttl: float = 0
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+
+        # key -> (value, fresh_until, stale_until)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._refreshing: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+        self._counters = {
+            "hits": 0,
+            "negative_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+        }
+
+    # LOOKUP / STORE
+    def _lookup(self, key: Hashable):
+        """Returns (state, value, needs_refresh); state is fresh / stale / miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return "miss", None, False
+
+            value, fresh_until, stale_until = entry
+            if now < fresh_until:
+                self._entries.move_to_end(key)
+                self._counters["negative_hits" if value is None else "hits"] += 1
+                return "fresh", value, False
+
+            if now < stale_until:
+                self._entries.move_to_end(key)
+                self._counters["stale_hits"] += 1
+                needs_refresh = key not in self._refreshing
+                self._refreshing.add(key)
+                return "stale", value, needs_refresh
+
+            del self._entries[key]
+            self._counters["misses"] += 1
+            return "miss", None, False
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns a fresh entry (no loading, no stale serving)."""
+        state, value, _ = self._lookup(key)
+        if state == "stale":
+            with self._lock:
+                self._refreshing.discard(key)
+        return value if state == "fresh" else default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (value, now + ttl, now + ttl + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _finish_refresh(self, key: Hashable, value: Any = None, failed: bool = False) -> None:
+        if not failed:
+            self.set(key, value)
+        with self._lock:
+            self._refreshing.discard(key)
+            self._counters["refresh_failures" if failed else "refreshes"] += 1
+
+    # SYNC API
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        state, value, needs_refresh = self._lookup(key)
+
+        if state == "fresh":
+            return value
+
+        if state == "stale":
+            if needs_refresh:
+                threading.Thread(
+                    target=self._refresh,
+                    args=(key, loader),
+                    name=f"{self.name}-cache-refresh",
+                    daemon=True
+                ).start()
+            return value
+
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        try:
+            value = loader()
+        except Exception as e:
+            print(f"[{self.name.upper()} CACHE] Background refresh failed for {key}: {e}")
+            self._finish_refresh(key, failed=True)
+            return
+        self._finish_refresh(key, value)
+
+    # ASYNC API
+    async def aget_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        state, value, needs_refresh = self._lookup(key)
+
+        if state == "fresh":
+            return value
+
+        if state == "stale":
+            if needs_refresh:
+                task = asyncio.get_running_loop().create_task(self._arefresh(key, loader))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value
+
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    async def _arefresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            value = await loader()
+        except Exception as e:
+            print(f"[{self.name.upper()} CACHE] Background refresh failed for {key}: {e}")
+            self._finish_refresh(key, failed=True)
+            return
+        self._finish_refresh(key, value)
+
+    # ADMIN
+    def invalidate(self, key: Optional[Hashable] = None) -> int:
+        """Drops one key (or everything when key is None). Returns entries removed."""
+        with self._lock:
+            if key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            return 1 if self._entries.pop(key, None) is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                **self._counters,
+            }
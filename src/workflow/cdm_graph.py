@@ -4,11 +4,16 @@ from typing import TypedDict
 
 # Orchestrator state
 from src.memory.agentstate import OrchestratorAgentState
+from src.workflow.workflow_registry import workflow_registry
 
 # Nodes
-from src.tools.data_retriever import fetch_tariff_data, fetch_valuation_data
-from src.agents.cdm_executor_agent import cdm_executor_agent
-from src.agents.cdm_decision_agent import cdm_decision_agent
+from src.tools.data_retriever import (
+    fetch_reference_data,
+    afetch_reference_data,
+    store_reference_data
+)
+from src.agents.cdm_executor_agent import cdm_executor_agent, acdm_executor_agent
+from src.agents.cdm_decision_agent import cdm_decision_agent, acdm_decision_agent
 
 
 # LangGraph state wrapper
@@ -16,19 +21,82 @@ class GraphState(TypedDict):
     orch: OrchestratorAgentState
 
 
+# Reference data each risk type needs before verification
+RISK_TYPE_SOURCES = {
+    "TARIFF": ("tariff",),
+    "VALUATION": ("valuation",),
+}
+
+
+def _risk_type(orch: OrchestratorAgentState) -> str:
+    risk_profile = orch.cdm_input.risk_profile if orch.cdm_input else None
+    if risk_profile is None:
+        return ""
+    return (risk_profile.risk_type or "").upper().strip()
+
+
+def _hs_code(orch: OrchestratorAgentState):
+    if orch.cdm_extracted and orch.cdm_extracted.declaration_details:
+        return orch.cdm_extracted.declaration_details.hs_code
+    return None
+
+
+def _missing_sources(orch: OrchestratorAgentState):
+    resolved = orch.cdm_extracted.resolved_sources if orch.cdm_extracted else []
+    return [
+        source
+        for source in RISK_TYPE_SOURCES.get(_risk_type(orch), ())
+        if source not in resolved
+    ]
+
+
+# ROUTER: only retrieve what the verifier for this risk type needs
+def route_by_risk_type(state: GraphState) -> str:
+    orch = state["orch"]
+    risk_type = _risk_type(orch)
+
+    if risk_type not in RISK_TYPE_SOURCES:
+        print(f"[ROUTER] Unknown risk_type: {risk_type}; skipping retrieval")
+        return "decide"
+
+    if orch.cdm_decision is not None:
+        # Already verified (e.g. batched per declaration)
+        return "decide"
+
+    if not _missing_sources(orch):
+        # Reference data was prefetched for the declaration
+        return "execute"
+
+    return "retrieve"
+
+
 # NODE: DATA RETRIEVER
 def retriever_node(state: GraphState):
     print("---> RUNNING DATA RETRIEVER NODE")
     orch = state["orch"]
 
-    # Fetch Tariff based on declaration
-    hs_code = None
-    if orch.cdm_extracted and orch.cdm_extracted.declaration_details:
-        hs_code = orch.cdm_extracted.declaration_details.hs_code
+    # Fetch reference data based on declaration (sources run concurrently)
+    hs_code = _hs_code(orch)
 
     if hs_code:
-        orch = fetch_tariff_data(hs_code, orch)
-        orch = fetch_valuation_data(hs_code, orch)
+        results = fetch_reference_data(hs_code, _missing_sources(orch))
+        orch = store_reference_data(orch, results)
+    else:
+        print("[DATA RETRIEVER] No HS code found in declaration.")
+
+    state["orch"] = orch
+    return state
+
+
+async def aretriever_node(state: GraphState):
+    print("---> RUNNING DATA RETRIEVER NODE")
+    orch = state["orch"]
+
+    hs_code = _hs_code(orch)
+
+    if hs_code:
+        results = await afetch_reference_data(hs_code, _missing_sources(orch))
+        orch = store_reference_data(orch, results)
     else:
         print("[DATA RETRIEVER] No HS code found in declaration.")
 
@@ -45,6 +113,14 @@ def executor_node(state: GraphState):
     return state
 
 
+async def aexecutor_node(state: GraphState):
+    print("---> RUNNING CDM EXECUTOR NODE")
+    orch = state["orch"]
+    orch = await acdm_executor_agent(orch)
+    state["orch"] = orch
+    return state
+
+
 # NODE: CDM DECISION
 def decision_node(state: GraphState):
     print("---> RUNNING CDM DECISION NODE")
@@ -54,16 +130,32 @@ def decision_node(state: GraphState):
     return state
 
 
+async def adecision_node(state: GraphState):
+    print("---> RUNNING CDM DECISION NODE")
+    orch = state["orch"]
+    orch = await acdm_decision_agent(orch)
+    state["orch"] = orch
+    return state
+
+
 # BUILD LANGGRAPH WORKFLOW
-def build_cdm_workflow():
+def build_cdm_workflow(use_async: bool = False):
     workflow = StateGraph(GraphState)
 
-    workflow.add_node("retrieve", retriever_node)
-    workflow.add_node("execute", executor_node)
-    workflow.add_node("decide", decision_node)
-
-    # Set execution order
-    workflow.set_entry_point("retrieve")
+    if use_async:
+        workflow.add_node("retrieve", aretriever_node)
+        workflow.add_node("execute", aexecutor_node)
+        workflow.add_node("decide", adecision_node)
+    else:
+        workflow.add_node("retrieve", retriever_node)
+        workflow.add_node("execute", executor_node)
+        workflow.add_node("decide", decision_node)
+
+    # Set execution order (unknown risk types go straight to decide)
+    workflow.set_conditional_entry_point(
+        route_by_risk_type,
+        {"retrieve": "retrieve", "execute": "execute", "decide": "decide"}
+    )
     workflow.add_edge("retrieve", "execute")
     workflow.add_edge("execute", "decide")
     workflow.add_edge("decide", END)
@@ -71,8 +163,28 @@ def build_cdm_workflow():
     return workflow.compile()
 
 
+# COMPILED WORKFLOW VARIANTS (built once per process)
+CDM_WORKFLOW = "cdm"
+CDM_ASYNC_WORKFLOW = "cdm_async"
+
+workflow_registry.register(CDM_WORKFLOW, lambda: build_cdm_workflow())
+workflow_registry.register(CDM_ASYNC_WORKFLOW, lambda: build_cdm_workflow(use_async=True))
+
+
 # RUN WORKFLOW
-def run_cdm_manager(orch_state: OrchestratorAgentState) -> OrchestratorAgentState:
-    app = build_cdm_workflow()
+def run_cdm_manager(
+    orch_state: OrchestratorAgentState,
+    workflow: str = CDM_WORKFLOW
+) -> OrchestratorAgentState:
+    app = workflow_registry.get(workflow)
     result = app.invoke({"orch": orch_state})
     return result["orch"]
+
+
+async def arun_cdm_manager(
+    orch_state: OrchestratorAgentState,
+    workflow: str = CDM_ASYNC_WORKFLOW
+) -> OrchestratorAgentState:
+    app = workflow_registry.get(workflow)
+    result = await app.ainvoke({"orch": orch_state})
+    return result["orch"]
@@ -0,0 +1,342 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+# Job store / worker pool settings
+JOB_STORE_PATH = os.getenv("CDM_JOB_STORE_PATH", "data/cdm_jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("CDM_JOB_WORKERS", "4"))
+# Running jobs are owned by one process, which refreshes their heartbeat;
+# jobs whose heartbeat is older than JOB_STALE_AFTER are requeued by any process
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("CDM_JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_STALE_AFTER = float(os.getenv("CDM_JOB_STALE_AFTER", "60"))
+# Idle workers also poll the store this often, so jobs queued by other
+# (or crashed) processes are picked up without a local submit
+JOB_POLL_INTERVAL = float(os.getenv("CDM_JOB_POLL_INTERVAL", "5"))
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+JobRunner = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class JobStore:
+    """SQLite-backed job table; survives worker restarts."""
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cdm_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    claimed_by TEXT,
+                    heartbeat_at REAL
+                )
+                """
+            )
+            # Stores created before ownership tracking
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(cdm_jobs)")}
+            for column, kind in (("claimed_by", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE cdm_jobs ADD COLUMN {column} {kind}")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cdm_jobs_status ON cdm_jobs (status, created_at)"
+            )
+            self._conn.commit()
+
+    def create(self, request: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO cdm_jobs (id, status, request, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(request), time.time())
+            )
+            self._conn.commit()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM cdm_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["request"] = json.loads(job["request"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _update(self, sql: str, params: tuple) -> bool:
+        with self._lock:
+            changed = self._conn.execute(sql, params).rowcount
+            self._conn.commit()
+        return changed > 0
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """queued → running (owned by owner); False when the job was cancelled or taken meanwhile."""
+        now = time.time()
+        return self._update(
+            "UPDATE cdm_jobs SET status = ?, started_at = ?, claimed_by = ?, heartbeat_at = ? "
+            "WHERE id = ? AND status = ?",
+            (RUNNING, now, owner, now, job_id, QUEUED)
+        )
+
+    def claim_next(self, owner: str) -> Optional[str]:
+        """Claims the oldest queued job, whichever process queued it; None when there is none."""
+        while True:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT id FROM cdm_jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (QUEUED,)
+                ).fetchone()
+            if row is None:
+                return None
+            if self.claim(row["id"], owner):
+                return row["id"]
+            # Taken (or cancelled) by someone else in between: try the next one
+
+    def heartbeat(self, owner: str, job_ids: List[str]) -> None:
+        """Marks the given jobs of the owner as still alive."""
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" for _ in job_ids)
+        self._update(
+            f"UPDATE cdm_jobs SET heartbeat_at = ? WHERE claimed_by = ? AND status = ? AND id IN ({placeholders})",
+            (time.time(), owner, RUNNING, *job_ids)
+        )
+
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        result: Any = None,
+        error: Optional[str] = None
+    ) -> bool:
+        return self._update(
+            "UPDATE cdm_jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+            "WHERE id = ? AND status IN (?, ?)",
+            (
+                status,
+                json.dumps(result) if result is not None else None,
+                error,
+                time.time(),
+                job_id,
+                QUEUED,
+                RUNNING,
+            )
+        )
+
+    def requeue_stale(self, stale_after: float = JOB_STALE_AFTER) -> List[str]:
+        """
+        Running jobs whose owner stopped sending heartbeats (crashed or
+        restarted process) go back to the queue. Jobs of live sibling
+        processes are left alone.
+        """
+        cutoff = time.time() - stale_after
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM cdm_jobs WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (RUNNING, cutoff)
+            ).fetchall()
+            job_ids = [row["id"] for row in rows]
+            for job_id in job_ids:
+                self._conn.execute(
+                    "UPDATE cdm_jobs SET status = ?, started_at = NULL, claimed_by = NULL, heartbeat_at = NULL "
+                    "WHERE id = ? AND status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                    (QUEUED, job_id, RUNNING, cutoff)
+                )
+            self._conn.commit()
+        return job_ids
+
+    def release(self, owner: str) -> int:
+        """Requeues the owner's running jobs right away (clean shutdown)."""
+        with self._lock:
+            changed = self._conn.execute(
+                "UPDATE cdm_jobs SET status = ?, started_at = NULL, claimed_by = NULL, heartbeat_at = NULL "
+                "WHERE claimed_by = ? AND status = ?",
+                (QUEUED, owner, RUNNING)
+            ).rowcount
+            self._conn.commit()
+        return changed
+
+    def queued_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM cdm_jobs WHERE status = ? ORDER BY created_at",
+                (QUEUED,)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM cdm_jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+class JobQueue:
+    """
+    In-process pool of asyncio workers draining a JobStore.
+
+    The store is the queue: workers claim the oldest queued job from it, so
+    any process sharing the store can run a job another one queued, and
+    queued / interrupted jobs are picked up again after a restart. A local
+    submit wakes an idle worker right away; otherwise idle workers poll
+    every JOB_POLL_INTERVAL seconds. Running jobs carry this process's
+    owner id and a heartbeat; only jobs whose heartbeat went stale are
+    requeued, so processes never re-run each other's live jobs. Store calls
+    run in a thread (SQLite blocks), and a failing store call is logged
+    without killing the worker. A running job is cancelled by cancelling
+    its task.
+    """
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        store: Optional[JobStore] = None,
+        workers: int = JOB_WORKERS
+    ):
+        self.runner = runner
+        self.store = store
+        self.workers = max(1, workers)
+        # Wake-up hints for idle workers (one per local submit / requeue)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+        self._stopping = False
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def start(self) -> None:
+        if self.store is None:
+            self.store = JobStore()
+        self._queue = asyncio.Queue()
+        self._stopping = False
+
+        requeued = await asyncio.to_thread(self.store.requeue_stale)
+        if requeued:
+            print(f"[JOB QUEUE] Requeued {len(requeued)} interrupted jobs")
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Interrupted jobs go straight back to the queue for the next process
+        if self.store is not None:
+            await asyncio.to_thread(self.store.release, self.owner)
+
+    async def submit(self, request: Dict[str, Any]) -> str:
+        if self._queue is None:
+            raise RuntimeError("Job queue is not started")
+        job_id = await asyncio.to_thread(self.store.create, request)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancels a queued or running job; False when it already finished."""
+        if not await asyncio.to_thread(self.store.finish, job_id, CANCELLED):
+            return False
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "jobs": self.store.counts() if self.store else {},
+        }
+
+    async def _heartbeat(self) -> None:
+        """Keeps this process's jobs alive and adopts jobs of dead processes."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                # Only jobs still in hand: one whose finish() failed goes stale and is rerun
+                await asyncio.to_thread(self.store.heartbeat, self.owner, list(self._running))
+                requeued = await asyncio.to_thread(self.store.requeue_stale)
+            except sqlite3.Error as e:
+                print(f"[JOB QUEUE] Heartbeat failed: {e}")
+                continue
+            if requeued:
+                print(f"[JOB QUEUE] Requeued {len(requeued)} jobs of a stopped process")
+            for job_id in requeued:
+                self._queue.put_nowait(job_id)
+
+    async def _wait_for_work(self) -> None:
+        try:
+            await asyncio.wait_for(self._queue.get(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self) -> None:
+        idle = False
+        while True:
+            if idle:
+                await self._wait_for_work()
+            try:
+                job_id = await asyncio.to_thread(self.store.claim_next, self.owner)
+                idle = job_id is None
+                if job_id is not None:
+                    await self._run(job_id)
+            except Exception as e:
+                # e.g. "database is locked" with several processes: keep the worker alive
+                print(f"[JOB QUEUE] Worker error: {e}")
+                idle = True
+
+    async def _run(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        task = asyncio.create_task(self.runner(job["request"]))
+        self._running[job_id] = task
+        try:
+            outcome = (SUCCEEDED, await task, None)
+        except asyncio.CancelledError:
+            if self._stopping or job_id not in self._cancelled:
+                # The worker itself is shutting down: leave the job to be requeued
+                raise
+            return  # already marked cancelled
+        except Exception as e:
+            outcome = (FAILED, None, str(e))
+        finally:
+            self._running.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+        status, result, error = outcome
+        await asyncio.to_thread(self.store.finish, job_id, status, result=result, error=error)
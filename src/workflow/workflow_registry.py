@@ -0,0 +1,54 @@
+import threading
+from typing import Any, Callable, Dict, List
+
+
+class WorkflowRegistry:
+    """
+    Process-wide registry of compiled LangGraph workflows.
+
+    Each named variant is compiled once (on first use or via warm_up) and the
+    compiled graph is shared by every request. Compiled graphs hold no
+    per-run state, so they can be invoked from any thread or event loop.
+    """
+
+    def __init__(self):
+        self._builders: Dict[str, Callable[[], Any]] = {}
+        self._compiled: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, builder: Callable[[], Any]) -> None:
+        """Register (or replace) the builder for a named graph variant."""
+        with self._lock:
+            self._builders[name] = builder
+            self._compiled.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        """Return the compiled graph, building it on first use."""
+        compiled = self._compiled.get(name)
+        if compiled is not None:
+            return compiled
+
+        with self._lock:
+            compiled = self._compiled.get(name)
+            if compiled is None:
+                if name not in self._builders:
+                    raise KeyError(f"Unknown workflow: {name}")
+                compiled = self._builders[name]()
+                self._compiled[name] = compiled
+        return compiled
+
+    def warm_up(self, *names: str) -> None:
+        """Compile the given variants (all registered ones by default)."""
+        for name in names or self.names():
+            self.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._builders)
+
+    def clear(self) -> None:
+        """Drop compiled graphs; they are rebuilt on next use."""
+        with self._lock:
+            self._compiled.clear()
+
+
+workflow_registry = WorkflowRegistry()
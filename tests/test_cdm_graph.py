@@ -0,0 +1,46 @@
+import pytest
+
+# cdm_graph pulls in the agents, which read the deployment's local config.py
+pytest.importorskip("config")
+
+from src.memory.agentstate import (  # noqa: E402
+    CDMDecision,
+    CDMExtracted,
+    CDMInput,
+    OrchestratorAgentState,
+    RiskProfile,
+)
+from src.workflow.cdm_graph import route_by_risk_type  # noqa: E402
+
+
+def _state(risk_type, resolved=(), decided=False):
+    orch = OrchestratorAgentState(
+        cdm_input=CDMInput(declaration_id="D1", risk_profile=RiskProfile(risk_id="R1", risk_type=risk_type)),
+        cdm_extracted=CDMExtracted(resolved_sources=list(resolved)),
+        cdm_decision=CDMDecision(risk_id="R1") if decided else None,
+    )
+    return {"orch": orch}
+
+
+@pytest.mark.parametrize("risk_type", ["TARIFF", "tariff ", "Valuation"])
+def test_known_risk_types_retrieve_their_source(risk_type):
+    assert route_by_risk_type(_state(risk_type)) == "retrieve"
+
+
+@pytest.mark.parametrize("risk_type", ["ORIGIN", "", None])
+def test_unknown_risk_types_skip_retrieval(risk_type):
+    assert route_by_risk_type(_state(risk_type)) == "decide"
+
+
+def test_prefetched_source_goes_straight_to_execution():
+    assert route_by_risk_type(_state("TARIFF", resolved=["tariff"])) == "execute"
+    # Another risk type's source does not count
+    assert route_by_risk_type(_state("VALUATION", resolved=["tariff"])) == "retrieve"
+
+
+def test_already_decided_risk_is_not_verified_again():
+    assert route_by_risk_type(_state("TARIFF", decided=True)) == "decide"
+
+
+def test_missing_risk_profile_skips_retrieval():
+    assert route_by_risk_type({"orch": OrchestratorAgentState(cdm_input=CDMInput())}) == "decide"
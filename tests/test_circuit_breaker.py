@@ -0,0 +1,88 @@
+import pytest
+
+from src.utils import circuit_breaker
+from src.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Shed(Exception):
+    """An exception that says nothing about the dependency."""
+
+
+def _not_shed(e: Exception) -> bool:
+    return not isinstance(e, Shed)
+
+
+@pytest.fixture
+def breaker(clock, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return CircuitBreaker("test", failure_threshold=2, reset_timeout=10, half_open_calls=1)
+
+
+def _fail(breaker, exc=RuntimeError("down")):
+    with pytest.raises(type(exc)):
+        with breaker.guard(_not_shed):
+            raise exc
+
+
+def _succeed(breaker):
+    with breaker.guard(_not_shed):
+        pass
+
+
+def test_opens_after_consecutive_failures(breaker):
+    _fail(breaker)
+    assert breaker.state == CLOSED
+    _fail(breaker)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        _succeed(breaker)
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_success_resets_the_failure_count(breaker):
+    _fail(breaker)
+    _succeed(breaker)
+    _fail(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_trial_closes_or_reopens(breaker, clock):
+    _fail(breaker)
+    _fail(breaker)
+    clock.advance(10)
+    assert breaker.state == HALF_OPEN
+    _fail(breaker)
+    assert breaker.state == OPEN
+
+    clock.advance(10)
+    _succeed(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_only_the_trial_calls(breaker, clock):
+    _fail(breaker)
+    _fail(breaker)
+    clock.advance(10)
+    with breaker.guard(_not_shed):
+        assert breaker.is_open()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+    assert breaker.state == CLOSED
+
+
+def test_neutral_exception_does_not_close_a_half_open_breaker(breaker, clock):
+    _fail(breaker)
+    _fail(breaker)
+    clock.advance(10)
+    _fail(breaker, Shed("scheduler full"))
+    assert breaker.state == HALF_OPEN
+    assert not breaker.is_open()  # the trial slot was given back
+    _fail(breaker)
+    assert breaker.state == OPEN
+
+
+def test_neutral_exception_keeps_the_failure_count(breaker):
+    _fail(breaker)
+    _fail(breaker, Shed("scheduler full"))
+    _fail(breaker)
+    assert breaker.state == OPEN
@@ -0,0 +1,71 @@
+import pytest
+
+from src.tools.hs_code_index import HSCodeIndex
+
+ROWS = [
+    {"hscode": "01", "goods_description": "live animals"},
+    {"hscode": "0101", "goods_description": "horses"},
+    {"hscode": "0101.21", "goods_description": "pure-bred breeding horses"},
+    {"hscode": "010121000010", "goods_description": "national line"},
+    {"hscode": "0203.11.00", "goods_description": "pork carcasses"},
+    {"hscode": "0203.11.00", "goods_description": "duplicate"},
+]
+
+
+@pytest.fixture
+def index():
+    index = HSCodeIndex(load_rows=lambda: iter(ROWS))
+    index.reload()
+    return index
+
+
+@pytest.mark.parametrize("declared, code, match", [
+    ("010121000010", "010121000010", "exact"),
+    ("0101.21", "010121", "exact"),
+    ("0101210000", "010121", "prefix"),   # 10 digits → 6-digit subheading
+    ("01019900", "0101", "prefix"),       # 8 → 6 (absent) → 4-digit heading
+    ("01990000", "01", "prefix"),         # down to the chapter
+    ("0203", "02031100", "extension"),    # less specific than the table
+])
+def test_lookup_levels(index, declared, code, match):
+    result = index.lookup(declared)
+    assert (result.code, result.match) == (code, match)
+
+
+def test_lookup_respects_min_digits(index):
+    assert index.lookup("01990000", min_digits=4) is None
+    assert index.lookup("01019900", min_digits=4).code == "0101"
+    assert index.lookup("02", min_digits=6) is None
+
+
+def test_first_row_wins_on_duplicate_codes(index):
+    assert index.get("0203 11 00")["goods_description"] == "pork carcasses"
+    assert len(index) == 5
+
+
+def test_miss_and_unloaded_index():
+    assert HSCodeIndex(load_rows=lambda: ROWS).lookup("0101") is None
+    index = HSCodeIndex(load_rows=lambda: ROWS)
+    index.reload()
+    assert index.lookup("9999") is None
+    assert index.lookup("") is None
+
+
+def test_refresh_only_when_the_signature_changes():
+    signature = {"value": 1}
+    loads = []
+
+    def load_rows():
+        loads.append(1)
+        return ROWS
+
+    index = HSCodeIndex(load_rows=load_rows, load_signature=lambda: signature["value"])
+    assert index.refresh_if_changed()
+    assert not index.refresh_if_changed()
+    signature["value"] = 2
+    assert index.refresh_if_changed()
+    assert len(loads) == 2
+
+
+def test_under_lists_codes_in_a_chapter(index):
+    assert [row["hscode"] for row in index.under("0101")] == ["0101", "0101.21", "010121000010"]
@@ -0,0 +1,140 @@
+import asyncio
+from contextlib import ExitStack
+
+import pytest
+
+from src.utils import llm_scheduler
+from src.utils.llm_scheduler import BATCH, INTERACTIVE, LLMOverloadedError, LLMScheduler
+
+
+@pytest.fixture(autouse=True)
+def fake_time(clock, monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "time", clock)
+
+
+def _scheduler(**kwargs):
+    settings = dict(
+        initial_limit=2, min_limit=1, max_limit=4, target_latency=10,
+        backoff_factor=0.5, max_queue=8, max_queue_wait=1
+    )
+    settings.update(kwargs)
+    return LLMScheduler(**settings)
+
+
+def _fill(scheduler, calls):
+    with ExitStack() as stack:
+        for _ in range(calls):
+            stack.enter_context(scheduler.slot())
+
+
+def test_limit_is_clamped_to_its_bounds():
+    assert _scheduler(initial_limit=0).limit == 1
+    assert _scheduler(initial_limit=100).limit == 4
+    assert _scheduler(min_limit=0).min_limit == 1
+
+
+def test_fast_calls_grow_the_limit_only_when_it_is_used():
+    scheduler = _scheduler(initial_limit=4, max_limit=8)
+    _fill(scheduler, 1)
+    assert scheduler.limit == 4
+
+    _fill(scheduler, 4)
+    assert scheduler.limit > 4
+    for _ in range(50):
+        _fill(scheduler, int(scheduler.limit))
+    assert scheduler.limit == 8
+
+
+def test_failures_and_slow_calls_back_off_multiplicatively(clock):
+    scheduler = _scheduler(initial_limit=4)
+    with pytest.raises(RuntimeError):
+        with scheduler.slot():
+            raise RuntimeError("backend error")
+    assert scheduler.limit == 2
+
+    clock.advance(1)
+    with scheduler.slot():
+        clock.advance(11)
+    assert scheduler.limit == 1
+
+    clock.advance(1)
+    with pytest.raises(RuntimeError):
+        with scheduler.slot():
+            raise RuntimeError("backend error")
+    assert scheduler.limit == 1  # never below min_limit
+
+
+def test_backs_off_once_per_round(clock):
+    scheduler = _scheduler(initial_limit=4)
+    with pytest.raises(RuntimeError):
+        with scheduler.slot():
+            clock.advance(1)
+            with pytest.raises(RuntimeError):
+                with scheduler.slot():
+                    raise RuntimeError("backend error")
+            raise RuntimeError("backend error")
+    # The outer call started before the first decrease: same round
+    assert scheduler.limit == 2
+    assert scheduler.stats()["limit_decreases"] == 1
+
+
+def test_full_queue_rejects_instead_of_waiting():
+    scheduler = _scheduler(initial_limit=1, max_queue=0)
+    with scheduler.slot():
+        with pytest.raises(LLMOverloadedError):
+            with scheduler.slot():
+                pass
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_queue_wait_times_out():
+    scheduler = _scheduler(initial_limit=1, max_queue_wait=0.01)
+    with scheduler.slot():
+        with pytest.raises(LLMOverloadedError):
+            with scheduler.slot():
+                pass
+    stats = scheduler.stats()
+    assert stats["queue_timeouts"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_waiters_are_admitted_by_priority_then_fifo():
+    scheduler = _scheduler(initial_limit=1)
+    order = []
+
+    async def call(name, priority):
+        async with scheduler.aslot(priority):
+            order.append(name)
+
+    async def scenario():
+        async with scheduler.aslot():
+            tasks = [
+                asyncio.ensure_future(call("batch-1", BATCH)),
+                asyncio.ensure_future(call("batch-2", BATCH)),
+                asyncio.ensure_future(call("interactive", INTERACTIVE)),
+            ]
+            await asyncio.sleep(0)
+            assert scheduler.stats()["queue_depth"] == {"interactive": 1, "batch": 2}
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["interactive", "batch-1", "batch-2"]
+
+
+def test_cancelled_waiter_gives_its_place_up():
+    scheduler = _scheduler(initial_limit=1)
+
+    async def scenario():
+        async with scheduler.aslot():
+            waiter = asyncio.ensure_future(scheduler.aslot().__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        async with scheduler.aslot():
+            pass
+
+    asyncio.run(scenario())
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == {"interactive": 0, "batch": 0}
@@ -0,0 +1,71 @@
+import pytest
+
+from src.tools import reference_snapshot
+from src.tools.reference_snapshot import ORIGIN_API, ORIGIN_TABLE, ReferenceSnapshot, SnapshotSyncer
+
+MAX_AGE = 60
+
+
+@pytest.fixture
+def snapshot(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(reference_snapshot, "time", clock)
+    return ReferenceSnapshot(str(tmp_path / "snapshot.sqlite3"))
+
+
+def test_get_serves_fresh_and_expires_old_entries(snapshot, clock):
+    snapshot.put("tariff", "0101.21", '{"duty": 5}')
+    assert snapshot.get("tariff", "010121", max_age=MAX_AGE) == '{"duty": 5}'
+
+    clock.advance(MAX_AGE + 1)
+    assert snapshot.get("tariff", "010121", max_age=MAX_AGE) is None
+    assert snapshot.stats()["sources"]["tariff"]["expired"] == 1
+
+
+def test_unchanged_table_sync_keeps_table_rows_from_expiring(snapshot, clock):
+    loads = []
+
+    def load_items():
+        loads.append(1)
+        return [("0101", '{"duty": 5}'), ("0102", '{"duty": 10}')]
+
+    syncer = SnapshotSyncer(snapshot)
+    syncer.add_table_source("tariff", load_items, lambda: ("tariff_data", 2))
+    assert syncer.sync_table("tariff") == 2
+    snapshot.put("tariff", "0201", '{"duty": 0}', origin=ORIGIN_API)
+
+    clock.advance(MAX_AGE + 1)
+    assert syncer.sync_table("tariff") == 0
+    assert len(loads) == 1  # same signature: not copied again
+
+    assert snapshot.get("tariff", "0101", max_age=MAX_AGE) == '{"duty": 5}'
+    assert snapshot.get("tariff", "0102", max_age=MAX_AGE) == '{"duty": 10}'
+    # API entries are renewed by the delta refresh, not by the table sync
+    assert snapshot.get("tariff", "0201", max_age=MAX_AGE) is None
+    assert snapshot.stats()["sources"]["tariff"]["staleness"] == 0
+
+
+def test_changed_table_sync_replaces_table_rows_only(snapshot, clock):
+    items = [("0101", '{"duty": 5}'), ("0102", '{"duty": 10}')]
+    signature = {"value": 1}
+    syncer = SnapshotSyncer(snapshot)
+    syncer.add_table_source("tariff", lambda: list(items), lambda: signature["value"])
+    syncer.sync_table("tariff")
+    snapshot.put("tariff", "0201", '{"duty": 0}', origin=ORIGIN_API)
+    version = snapshot.version("tariff")
+
+    items[:] = [("0101", '{"duty": 7}')]
+    signature["value"] = 2
+    clock.advance(1)
+    assert syncer.sync_table("tariff") == 2  # 0101 changed, 0102 deleted
+
+    assert snapshot.get("tariff", "0101") == '{"duty": 7}'
+    assert snapshot.get("tariff", "0102") is None
+    assert snapshot.get("tariff", "0201") == '{"duty": 0}'
+    assert [row["hs_code"] for row in snapshot.changed_since("tariff", version)] == ["0101"]
+
+
+def test_stale_codes_only_lists_api_entries(snapshot, clock):
+    snapshot.put("valuation", "0101", '{"price": 1}')
+    snapshot.put("valuation", "0102", '{"price": 2}', origin=ORIGIN_TABLE)
+    clock.advance(MAX_AGE + 1)
+    assert snapshot.stale_codes("valuation", MAX_AGE, limit=10) == ["0101"]
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight.stats()["coalesced"] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert results == ["value"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 4, "executions": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_errors_are_shared_and_not_kept():
+    flight = SingleFlight("test")
+
+    def fail():
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", fail)
+    assert flight.do("k", lambda: "ok") == "ok"
+
+
+def test_async_callers_share_one_task():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def scenario():
+        return await asyncio.gather(*(flight.ado("k", load) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["value"] * 5
+    assert len(calls) == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flight = SingleFlight("test")
+
+    async def load():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.ado("k", load))
+        second = asyncio.ensure_future(flight.ado("k", load))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "value"
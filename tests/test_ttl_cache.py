@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from src.utils import ttl_cache
+from src.utils.ttl_cache import TTLCache
+
+
+@pytest.fixture
+def cache(clock, monkeypatch):
+    monkeypatch.setattr(ttl_cache, "time", clock)
+    return TTLCache("test", maxsize=2, ttl=10, negative_ttl=5)
+
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    clock.advance(10)
+    assert cache.get("a") is None
+
+
+def test_negative_entries_use_negative_ttl(cache, clock):
+    loads = []
+    load = lambda: loads.append(1)  # returns None
+
+    assert cache.get_or_load("a", load) is None
+    assert cache.get_or_load("a", load) is None
+    assert len(loads) == 1
+    clock.advance(5)
+    cache.get_or_load("a", load)
+    assert len(loads) == 2
+    assert cache.stats()["negative_hits"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_loader_exceptions_are_not_cached(cache):
+    def fail():
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("a", fail)
+    assert cache.get_or_load("a", lambda: 1) == 1
+
+
+def test_stale_entry_is_served_while_it_refreshes(clock, monkeypatch):
+    monkeypatch.setattr(ttl_cache, "time", clock)
+    cache = TTLCache("test", ttl=10, stale_ttl=10)
+    cache.set("a", 1)
+    clock.advance(15)
+
+    async def load():
+        return 2
+
+    async def scenario():
+        assert await cache.aget_or_load("a", load) == 1
+        await asyncio.gather(*cache._tasks)
+        return await cache.aget_or_load("a", load)
+
+    assert asyncio.run(scenario()) == 2
+    assert cache.stats()["refreshes"] == 1
+
+
+def test_invalidate(cache):
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.invalidate("a") == 1
+    assert cache.invalidate("a") == 0
+    assert cache.invalidate() == 1